@@ -1,8 +1,7 @@
-
 # -*- coding: utf-8 -*-
 import os
 import sys
-import sqlite3
+import time
 from pathlib import Path
 
 import streamlit as st
@@ -14,6 +13,17 @@ sys.path.insert(0, str(Path(__file__).resolve().parent))
 import utils.scraping_bs as scraping
 import utils.cleaning as cleaning
 import utils.charts as charts
+import utils.images as images
+import utils.dedup as dedup
+import utils.frames as frames
+import utils.csv_preview as csv_preview
+import utils.pipeline as pipeline
+import utils.ws_loader as ws_loader
+import utils.export as export
+import utils.sketches as sketches
+import utils.reader as reader
+import utils.profiling as profiling
+import utils.partitions as partitions
 # On évite d'utiliser utils.db ici pour l'affichage pour rester agnostique du chemin
 # import utils.db as dbutils
 
@@ -36,13 +46,17 @@ if css_path.exists():
 # -----------------------------------------------------------------------------
 DB_PATH  = st.secrets.get("DB_PATH", os.environ.get("DB_PATH", "coinafrique.db"))
 DB_TABLE = st.secrets.get("DB_TABLE", os.environ.get("DB_TABLE", "annonces"))
+# 'single' : une seule base DB_PATH ; 'partitioned' : un fichier par catégorie × mois (utils.partitions)
+DB_STORAGE = str(st.secrets.get("DB_STORAGE", os.environ.get("DB_STORAGE", "single"))).strip().lower()
+PART_ROOT = Path(st.secrets.get("PART_ROOT", os.environ.get("PART_ROOT", str(partitions.PART_ROOT))))
+PARTITIONED = DB_STORAGE == 'partitioned'
 
 # Flag DEBUG (ne rien afficher par défaut pour l'utilisateur final)
 DEBUG = str(st.secrets.get("DEBUG", os.environ.get("DEBUG", "0"))).strip() in ("1", "true", "True", "YES", "yes")
 
 # Affichage d'un rappel des paramètres DB (uniquement en mode DEBUG)
 if DEBUG:
-    st.sidebar.caption(f"💾 DB: `{DB_PATH}` · Table: `{DB_TABLE}`")
+    st.sidebar.caption(f"💾 DB: `{PART_ROOT if PARTITIONED else DB_PATH}` · Table: `{DB_TABLE}` · Stockage: `{DB_STORAGE}`")
 
 # -----------------------------------------------------------------------------
 # Constantes & répertoires
@@ -70,18 +84,15 @@ def load_db(db_path: str = DB_PATH, table: str = DB_TABLE, category: str | None
     Lecture de la DB SQLite en s’assurant d’utiliser le même chemin que le scraper.
     Renvoie un DataFrame vide si le fichier ou la table n’existent pas.
     """
-    db_file = Path(db_path)
-    if not db_file.exists():
-        return pd.DataFrame()
+    if PARTITIONED:
+        # seules les partitions de la catégorie, du mois le plus récent vers le plus ancien
+        return partitions.load_listings(PART_ROOT, table, category=category, limit=limit)
 
-    with sqlite3.connect(str(db_file)) as conn:
-        # Vérification de la table
-        exists = conn.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,)
-        ).fetchone()
-        if not exists:
-            return pd.DataFrame()
+    # connexion lecture seule partagée ; résultat en cache tant que la base n'a pas changé
+    if not reader.table_exists(db_path, table):
+        return pd.DataFrame()
 
+    def build(conn):
         if category:
             # category provient d'une liste fermée (sélecteur)
             q = f"SELECT * FROM {table} WHERE category = ? ORDER BY id DESC LIMIT ?;"
@@ -89,8 +100,9 @@ def load_db(db_path: str = DB_PATH, table: str = DB_TABLE, category: str | None
         else:
             q = f"SELECT * FROM {table} ORDER BY id DESC LIMIT ?;"
             df = pd.read_sql_query(q, conn, params=(int(limit),))
+        return frames.compact_frame(df)
 
-    return df
+    return reader.cached(db_path, ('load_db', table, category, int(limit)), build, default=pd.DataFrame())
 
 def harmonize_columns_for_display(df: pd.DataFrame, category: str) -> pd.DataFrame:
     """
@@ -110,46 +122,50 @@ def harmonize_columns_for_display(df: pd.DataFrame, category: str) -> pd.DataFra
             df2 = df2.rename(columns={'title': 'Nom'})
 
     # Ordre de colonnes recommandé
-    preferred = ['id', 'category', 'Nom', 'details', 'price_raw', 'address_raw', 'image_url', 'link', 'page', 'source']
+    preferred = ['id', 'ad_id', 'category', 'Nom', 'details', 'price_raw', 'address_raw', 'image_url', 'link', 'page', 'source']
     cols = [c for c in preferred if c in df2.columns] + [c for c in df2.columns if c not in preferred]
     df2 = df2[cols]
     return df2
 
+def show_gallery(df: pd.DataFrame, n: int = 12, db_path: str = DB_PATH):
+    """
+    Galerie des premières annonces : image locale (data/raw/images) si déjà téléchargée,
+    sinon l'URL distante.
+    """
+    if df is None or df.empty or 'image_url' not in df.columns:
+        return
+    sub = df[df['image_url'].fillna('') != ''].head(n)
+    if sub.empty:
+        return
+    urls = tuple(sub['image_url'].tolist())
+    local = reader.cached(db_path, ('images', urls), lambda conn: images.local_image_paths(conn, list(urls)), default={})
+    cols = st.columns(6)
+    for i, (_, r) in enumerate(sub.iterrows()):
+        with cols[i % 6]:
+            st.image(local.get(r['image_url'], r['image_url']), caption=str(r.get('title') or '')[:40],
+                     use_container_width=True)
+
 def sync_cleaned_from_ws():
-    WS_EXPECTED = {
-        'chiens': WS_DIR / 'chiens.csv',
-        'moutons': WS_DIR / 'moutons.csv',
-        'poules_lapins_pigeons': WS_DIR / 'poules_lapins_pigeons.csv',
-        'autres_animaux': WS_DIR / 'autres_animaux.csv'
-    }
-    CLEAN_TARGETS = {
-        'chiens': CLEAN_DIR / 'chiens_clean.csv',
-        'moutons': CLEAN_DIR / 'moutons_clean.csv',
-        'poules_lapins_pigeons': CLEAN_DIR / 'poules_lapins_pigeons_clean.csv',
-        'autres_animaux': CLEAN_DIR / 'autres_animaux_clean.csv'
-    }
-    results = {}
-    for key, ws_path in WS_EXPECTED.items():
-        clean_path = CLEAN_TARGETS[key]
-        results[key] = {'ws': ws_path, 'clean': clean_path, 'status': 'skipped'}
-        if not ws_path.exists():
-            results[key]['status'] = 'missing_raw'
-            continue
-        need_refresh = (not clean_path.exists()) or (ws_path.stat().st_mtime > clean_path.stat().st_mtime)
-        if need_refresh:
-            try:
-                df_raw = pd.read_csv(ws_path)
-                if df_raw.empty:
-                    results[key]['status'] = 'raw_empty'
-                    continue
-                df_clean = cleaning.basic_cleaning(df_raw.copy(), dropna_thresh=0.7, drop_duplicates=True)
-                df_clean.to_csv(clean_path, index=False, encoding='utf-8')
-                results[key]['status'] = 'cleaned'
-            except Exception as e:
-                results[key]['status'] = f'error: {e}'
-        else:
-            results[key]['status'] = 'up_to_date'
-    return results
+    """
+    Nettoyage synchrone (pipeline parallèle, par morceaux, manifeste d'empreintes).
+    Le dashboard utilise plutôt pipeline.start_background() pour ne pas bloquer.
+    """
+    return pipeline.sync_cleaned(WS_DIR, CLEAN_DIR)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_dashboard_frames(fingerprint: tuple, paths: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    CSV nettoyés -> (toutes les annonces, un représentant par cluster de reposts).
+    Mis en cache sur les empreintes du manifeste : recalculé seulement quand un CSV change.
+    """
+    clean_all = frames.load_cleaned(paths)
+    if clean_all.empty:
+        return clean_all, clean_all
+    clean_all = cleaning.basic_cleaning(clean_all, dropna_thresh=0.0, drop_duplicates=False)
+    # Quasi-doublons (reposts) regroupés : un cluster = un animal
+    clean_all['dup_cluster'] = dedup.cluster_frame(clean_all)
+    clean_all = frames.compact_frame(clean_all)
+    return clean_all, clean_all.drop_duplicates(subset=['dup_cluster'])
 
 # -----------------------------------------------------------------------------
 # Pages
@@ -202,36 +218,102 @@ def show_scraper():
                     headless=True,
                     db_path=DB_PATH,       # ✅ même DB que l’affichage
                     table=DB_TABLE,        # ✅ même table que l’affichage
+                    partition_root=PART_ROOT if PARTITIONED else None,
                 )
                 st.success(f"Terminé — {inserted} nouvelles lignes insérées (INSERT OR IGNORE).")
             except Exception as e:
                 st.error(f'Erreur : {e}')
 
+    # Télécharger les images des annonces (stockage local, relance incrémentale)
+    # Base unique seulement : en mode partitionné, DB_PATH n'existe pas (sqlite3 créerait un fichier vide)
+    if st.button('Télécharger les images (cache local)', disabled=PARTITIONED,
+                 help='Indisponible avec le stockage partitionné.' if PARTITIONED else None):
+        with st.spinner('Téléchargement des images…'):
+            try:
+                res = images.fetch_images(db_path=DB_PATH, table=DB_TABLE)
+                st.success(
+                    f"{res['stored']} nouvelles images, {res['deduped']} doublons, {res['failed']} échecs "
+                    f"(sur {res['pending']} à récupérer)."
+                )
+            except Exception as e:
+                st.error(f'Erreur : {e}')
+
     # Afficher les données de la DB (même source)
     if st.button('Afficher les données en DB'):
-        df_db = load_db(DB_PATH, DB_TABLE, category=category, limit=500)
+        with profiling.section('lecture DB (load_db)'):
+            df_db = load_db(DB_PATH, DB_TABLE, category=category, limit=500)
         if df_db is None or df_db.empty:
             # Messages d'aide si vide
             db_file = Path(DB_PATH)
-            if not db_file.exists():
+            if PARTITIONED:
+                st.info(f"Aucune partition pour « {category} » sous `{PART_ROOT}`.")
+            elif not db_file.exists():
                 st.info(f"La base est vide ou introuvable à ce chemin : `{DB_PATH}`.")
             else:
                 st.info("La table est vide ou n'a pas encore été créée dans la DB.")
                 # (En DEBUG uniquement) lister les tables disponibles
                 if DEBUG:
                     try:
-                        with sqlite3.connect(str(db_file)) as conn:
-                            tables = conn.execute(
-                                "SELECT name FROM sqlite_master WHERE type='table';"
-                            ).fetchall()
+                        tables = reader.list_tables(str(db_file))
                         if tables:
-                            st.caption("Tables présentes : " + ", ".join(t[0] for t in tables))
+                            st.caption("Tables présentes : " + ", ".join(tables))
                     except Exception:
                         pass
         else:
-            df_disp = harmonize_columns_for_display(df_db, category)
+            with profiling.section('copie affichage'):
+                df_disp = harmonize_columns_for_display(df_db, category)
             st.success(f"{len(df_disp)} lignes chargées depuis `{DB_TABLE}` (catégorie: {category}).")
-            st.dataframe(df_disp.head(300), use_container_width=True)
+            # Clusters de quasi-doublons tenus à jour à l'insertion (utils.dedup.assign_new)
+            with profiling.section('animaux uniques'):
+                if PARTITIONED:
+                    n_unique = partitions.count_unique(PART_ROOT, DB_TABLE, category)
+                else:
+                    n_unique = reader.cached(DB_PATH, ('count_unique', DB_TABLE, category),
+                                             lambda conn: dedup.count_unique(conn, DB_TABLE, category), default=0)
+            st.metric('Animaux uniques en base (reposts regroupés)', n_unique)
+            with profiling.section('st.dataframe'):
+                st.dataframe(df_disp.head(300), use_container_width=True)
+            with profiling.section('galerie'):
+                show_gallery(df_db)
+
+    # Stockage partitionné : catalogue, compaction des mois clos, archivage des plus anciens
+    if PARTITIONED:
+        with st.expander('Partitions (catégorie × mois)'):
+            cat = partitions.catalog(PART_ROOT)
+            if cat.empty:
+                st.caption('Aucune partition pour le moment.')
+            else:
+                st.dataframe(cat, use_container_width=True)
+            months = st.number_input('Archiver au-delà de (mois)', min_value=1, max_value=120, value=12)
+            if st.button('Compacter et archiver'):
+                done = partitions.maintain(PART_ROOT, archive_after_months=int(months))
+                st.success(f"{len(done['compacted'])} partitions compactées, {len(done['archived'])} archivées.")
+
+    # Export pour les analystes : flux SQLite -> fichier (curseur par lots, mémoire constante)
+    with st.expander('Exporter les données (CSV / Parquet)'):
+        fmt = st.radio('Format', ('CSV', 'Parquet (partitionné catégorie/mois)'), horizontal=True)
+        only_cat = st.checkbox(f'Uniquement la catégorie « {category} »', value=True)
+        search = st.text_input('Titre contenant', '')
+        if PARTITIONED:
+            st.caption("Export indisponible avec le stockage partitionné (il lit la base unique `DB_PATH`).")
+        if st.button("Préparer l'export", disabled=PARTITIONED):
+            filters = dict(category=[category] if only_cat else None, search=search or None)
+            stamp = time.strftime('%Y%m%d_%H%M%S')
+            try:
+                if fmt == 'CSV':
+                    out = export.EXPORT_DIR / f"{DB_TABLE}_{stamp}.csv"
+                    n = export.export_csv(DB_PATH, DB_TABLE, out, **filters)
+                    mime = 'text/csv'
+                else:
+                    out_dir = export.EXPORT_DIR / f"{DB_TABLE}_{stamp}"
+                    n = sum(export.export_parquet(DB_PATH, DB_TABLE, out_dir, **filters).values())
+                    out = export.zip_dir(out_dir, out_dir.with_suffix('.zip'))
+                    mime = 'application/zip'
+                st.success(f'{n} lignes exportées → `{out}`')
+                with open(out, 'rb') as fh:
+                    st.download_button('Télécharger', fh, file_name=out.name, mime=mime)
+            except Exception as e:
+                st.error(f'Erreur : {e}')
 
 def show_ws_csv():
     st.header('WEB SCRAPER')
@@ -259,6 +341,17 @@ def show_ws_csv():
         if st.button('Autres animaux', use_container_width=True):
             st.session_state.ws_choice_file = FILE_MAP['Autres animaux']
 
+    # Import des CSV Web Scraper dans la même base que le scraper
+    if st.button('Charger tous les CSV en base', use_container_width=True):
+        with st.spinner('Chargement en base (par lots)…'), profiling.section('chargement CSV en base'):
+            res = ws_loader.load_ws_dir(WS_DIR, db_path=DB_PATH, table=DB_TABLE,
+                                        partition_root=PART_ROOT if PARTITIONED else None)
+        inserted = sum(r.get('inserted', 0) for r in res.values())
+        errors = [f"{k} : {r['error']}" for k, r in res.items() if 'error' in r]
+        st.success(f"{inserted} nouvelles lignes insérées dans `{DB_TABLE}` (INSERT OR IGNORE).")
+        for e in errors:
+            st.error(e)
+
     if not st.session_state.ws_choice_file:
         st.info("En attente d'une sélection…")
         return
@@ -268,21 +361,34 @@ def show_ws_csv():
         st.error(f'Fichier introuvable : {path.name}')
         return
 
+    # Lecture paginée : seule la fenêtre affichée est parsée (index d'offsets en cache)
+    PAGE_ROWS = 100
     try:
-        df = pd.read_csv(path)
+        with profiling.section('index CSV (shape)'):
+            n_rows, n_cols = csv_preview.shape(path)
+        n_pages = max(1, -(-n_rows // PAGE_ROWS))
+        page = st.number_input('Page', min_value=1, max_value=n_pages, value=1, step=1)
+        with profiling.section('lecture fenêtre CSV'):
+            df = csv_preview.read_window(path, start=(int(page) - 1) * PAGE_ROWS, nrows=PAGE_ROWS)
     except Exception as e:
         st.error(f'Lecture impossible : {e}')
         return
 
     st.subheader(f'Aperçu — {path.name}')
-    st.write(f'**Taille** : {df.shape[0]} lignes × {df.shape[1]} colonnes')
-    st.dataframe(df.head(100), use_container_width=True)
+    st.write(f'**Taille** : {n_rows} lignes × {n_cols} colonnes · page {int(page)}/{n_pages}')
+    st.dataframe(df, use_container_width=True)
 
 def show_dashboard():
     st.header('DASHBOARD (DONNÉES NETTOYÉES)')
     st.caption('Diagrammes construits à partir des CSV nettoyés (Web Scraper → nettoyage).')
 
-    _ = sync_cleaned_from_ws()
+    # Nettoyage hors requête : seuls les CSV dont le contenu a changé sont relancés en tâche de fond
+    with profiling.section('sync CSV (pipeline)'):
+        if pipeline.is_running():
+            st.info('Nettoyage des CSV en cours en arrière-plan — rechargez la page pour voir les données à jour.')
+        elif pipeline.pending(WS_DIR, CLEAN_DIR):
+            pipeline.start_background()
+            st.info('Nouveaux CSV détectés : nettoyage lancé en arrière-plan.')
 
     paths = {
         'Chiens': CLEAN_DIR / 'chiens_clean.csv',
@@ -290,33 +396,56 @@ def show_dashboard():
         'Poules-Lapins-Pigeons': CLEAN_DIR / 'poules_lapins_pigeons_clean.csv',
         'Autres animaux': CLEAN_DIR / 'autres_animaux_clean.csv'
     }
-    frames = []
-    for cat, p in paths.items():
-        if p.exists():
-            try:
-                df0 = pd.read_csv(p)
-                df0['category'] = cat
-                frames.append(df0)
-            except Exception:
-                pass
-
-    if not frames:
+    with profiling.section('CSV nettoyés + dédoublonnage (cache)'):
+        clean_all, unique_all = load_dashboard_frames(pipeline.cleaned_fingerprint(CLEAN_DIR), paths)
+    if clean_all.empty:
         st.warning("Aucun CSV nettoyé. Déposez d'abord des bruts en Option Web Scraper.")
         return
 
-    clean_all = pd.concat(frames, ignore_index=True)
-    clean_all = cleaning.basic_cleaning(clean_all, dropna_thresh=0.0, drop_duplicates=False)
-
+    if DEBUG:
+        with st.expander('Mémoire du DataFrame (objet vs compact)'):
+            st.dataframe(frames.memory_report(clean_all), use_container_width=True)
+    m1, m2 = st.columns(2)
+    m1.metric('Annonces', len(clean_all))
+    m2.metric('Animaux uniques (reposts regroupés)', len(unique_all))
+
+    # Construction des figures séparée du rendu pour pouvoir les mesurer à part
+    with profiling.section('figures plotly'):
+        figs = [
+            # reposts regroupés : un animal compté une fois dans chaque graphique
+            charts.chart_price_hist(unique_all),
+            charts.chart_price_by_category(unique_all),
+            charts.chart_top_cities(unique_all),
+            charts.chart_price_bins(unique_all),
+        ]
     c1, c2 = st.columns(2)
     c3, c4 = st.columns(2)
-    with c1:
-        st.plotly_chart(charts.chart_price_hist(clean_all), use_container_width=True)
-    with c2:
-        st.plotly_chart(charts.chart_price_by_category(clean_all), use_container_width=True)
-    with c3:
-        st.plotly_chart(charts.chart_top_cities(clean_all), use_container_width=True)
-    with c4:
-        st.plotly_chart(charts.chart_price_bins(clean_all), use_container_width=True)
+    with profiling.section('st.plotly_chart'):
+        for col, fig in zip((c1, c2, c3, c4), figs):
+            with col:
+                st.plotly_chart(fig, use_container_width=True)
+
+    # Bandes de prix (base SQLite) : quantiles lus dans les sketches KLL, sans relire l'historique
+    if PARTITIONED or Path(DB_PATH).exists():
+        with profiling.section('bandes de prix (sketches)'):
+            if PARTITIONED:
+                # sketches des partitions fusionnés par clé
+                by_city = partitions.price_bands(PART_ROOT, by='city', table=DB_TABLE)
+                by_week = partitions.price_bands(PART_ROOT, by='week', table=DB_TABLE)
+            else:
+                by_city = reader.cached(DB_PATH, ('bands', DB_TABLE, 'city'),
+                                        lambda conn: sketches.price_bands(conn, by='city', table=DB_TABLE))
+                by_week = reader.cached(DB_PATH, ('bands', DB_TABLE, 'week'),
+                                        lambda conn: sketches.price_bands(conn, by='week', table=DB_TABLE))
+        if not by_city.empty or not by_week.empty:
+            st.subheader('Bandes de prix p10–p90 (base SQLite)')
+            b1, b2 = st.columns(2)
+            if not by_city.empty:
+                with b1:
+                    st.plotly_chart(charts.chart_price_bands(by_city, by='city'), use_container_width=True)
+            if not by_week.empty:
+                with b2:
+                    st.plotly_chart(charts.chart_price_bands(by_week, by='week'), use_container_width=True)
 
 def show_feedback():
     st.header('FEEDBACK')
@@ -334,16 +463,18 @@ def show_feedback():
 # -----------------------------------------------------------------------------
 # Routing
 # -----------------------------------------------------------------------------
-if menu == 'Accueil':
-    show_home()
-elif menu == 'Scraper':
-    show_scraper()
-elif menu == 'Web Scraper (CSV brut)':
-    show_ws_csv()
-elif menu == 'Dashboard (nettoyé)':
-    show_dashboard()
-elif menu == 'Feedback':
-    show_feedback()
+PAGES = {
+    'Accueil': show_home,
+    'Scraper': show_scraper,
+    'Web Scraper (CSV brut)': show_ws_csv,
+    'Dashboard (nettoyé)': show_dashboard,
+    'Feedback': show_feedback,
+}
+
+# Profilage du rendu (DEBUG uniquement) : temps / allocations par section, flamegraph en option
+FLAMEGRAPH = DEBUG and st.sidebar.checkbox('Flamegraph du rendu (échantillonnage)', value=False)
+with profiling.page(menu, active=DEBUG, flamegraph=FLAMEGRAPH):
+    PAGES[menu]()
 
 # -----------------------------------------------------------------------------
 # (Optionnel) Diagnostic rapide pour Streamlit Cloud - seulement en DEBUG
@@ -358,3 +489,8 @@ if DEBUG:
             pass
         st.caption(f"DB_PATH utilisé: {DB_PATH}")
         st.caption(f"DB_TABLE utilisée: {DB_TABLE}")
+        st.caption(f"Profil du rendu — {menu} :")
+        st.dataframe(profiling.report(), use_container_width=True)
+        flame = profiling.last_flamegraph()
+        if flame:
+            st.caption(f"Flamegraph (piles repliées, flamegraph.pl / speedscope) : `{flame}`")
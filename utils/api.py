@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import json
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Tuple
+from urllib.parse import urlparse, parse_qs, urlencode
+
+from utils.cleaning import price_to_int, extract_city
+from utils.export import build_where
+
+# -----------------------------------------------------------------------------
+# API JSON locale, en lecture seule, sur la base des annonces
+#   GET /health
+#   GET /categories                       -> comptes par catégorie
+#   GET /listings?category=&since=&until=&q=&city=&min_price=&max_price=&after_id=&limit=
+#   GET /listings/<ad_id>
+# Sert une base unique (DB_PATH) : le stockage partitionné (utils.partitions) n'est pas exposé.
+# -----------------------------------------------------------------------------
+MAX_LIMIT = 500
+CACHE_SIZE = 256
+POOL_SIZE = 8                   # connexions lecture seule gardées ouvertes entre les requêtes
+
+def _connect_ro(db_path: str) -> sqlite3.Connection:
+    """Connexion en lecture seule (URI mode=ro), passée d'un thread à l'autre via le pool."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.create_function('price_int', 1, price_to_int, deterministic=True)
+    return conn
+
+# -----------------------------------------------------------------------------
+# Requêtes
+# -----------------------------------------------------------------------------
+def query_categories(conn, table: str) -> Dict:
+    rows = conn.execute(
+        f"SELECT category, COUNT(*) AS n FROM {table} GROUP BY category ORDER BY n DESC;"
+    ).fetchall()
+    return {'items': [dict(r) for r in rows]}
+
+def query_listing(conn, table: str, ad_id: int) -> Optional[Dict]:
+    r = conn.execute(f"SELECT * FROM {table} WHERE ad_id = ?;", (ad_id,)).fetchone()
+    return dict(r) if r else None
+
+def query_listings(conn, table: str, params: Dict[str, str]) -> Dict:
+    """
+    Filtres (category, since, until, q, city, min_price, max_price) + pagination par clé :
+    tri par id décroissant, after_id = dernier id de la page précédente (pas d'OFFSET).
+    """
+    where, args = build_where(
+        category=params.get('category') or None,
+        since=params.get('since') or None,
+        until=params.get('until') or None,
+        search=params.get('q') or None,
+    )
+    clauses = [where[len(" WHERE "):]] if where else []
+    if params.get('city'):
+        # même normalisation que la colonne city (et que le dashboard)
+        clauses.append("city = ?")
+        args.append(extract_city(params['city']) or params['city'])
+    if params.get('min_price'):
+        clauses.append("price_int(price_raw) >= ?")
+        args.append(int(params['min_price']))
+    if params.get('max_price'):
+        clauses.append("price_int(price_raw) <= ?")
+        args.append(int(params['max_price']))
+    if params.get('after_id'):
+        clauses.append("id < ?")
+        args.append(int(params['after_id']))
+    limit = max(1, min(int(params.get('limit') or 100), MAX_LIMIT))
+    sql_where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    rows = [dict(r) for r in conn.execute(
+        f"SELECT * FROM {table}{sql_where} ORDER BY id DESC LIMIT ?;", (*args, limit)
+    )]
+    next_after = rows[-1]['id'] if len(rows) == limit else None
+    return {'items': rows, 'next_after_id': next_after}
+
+# -----------------------------------------------------------------------------
+# Cache des réponses + ETag (invalidés via PRAGMA data_version)
+# -----------------------------------------------------------------------------
+def new_state(db_path: str, table: str = "annonces", cache_size: int = CACHE_SIZE,
+              pool_size: int = POOL_SIZE) -> Dict:
+    """
+    État partagé par les threads du serveur. data_version n'a de sens que pour une même
+    connexion : une connexion dédiée (watch) le surveille ; chaque changement (écriture par un
+    autre processus) incrémente la génération, qui entre dans l'ETag, et vide le cache LRU.
+    ThreadingHTTPServer crée un thread par requête : les connexions de lecture sont donc
+    partagées via un pool borné (pool_size connexions inactives au plus).
+    """
+    watch = _connect_ro(db_path)
+    return {
+        'db_path': db_path, 'table': table, 'cache_size': cache_size,
+        'pool': queue.Queue(maxsize=pool_size), 'lock': threading.Lock(),
+        'cache': OrderedDict(), 'boot': format(int(time.time()), 'x'),
+        'watch': watch, 'version': watch.execute("PRAGMA data_version;").fetchone()[0],
+        'generation': 0,
+    }
+
+@contextmanager
+def pooled_conn(state: Dict):
+    """Connexion empruntée au pool (ouverte si le pool est vide), rendue en sortie de bloc."""
+    try:
+        conn = state['pool'].get_nowait()
+    except queue.Empty:
+        conn = _connect_ro(state['db_path'])
+    try:
+        yield conn
+    finally:
+        try:
+            state['pool'].put_nowait(conn)
+        except queue.Full:
+            conn.close()            # pic de requêtes : connexion en surplus fermée
+
+def close_state(state: Dict) -> None:
+    while True:
+        try:
+            state['pool'].get_nowait().close()
+        except queue.Empty:
+            break
+    state['watch'].close()
+
+def refresh_generation(state: Dict) -> int:
+    with state['lock']:
+        v = state['watch'].execute("PRAGMA data_version;").fetchone()[0]
+        if v != state['version']:
+            state['version'] = v
+            state['generation'] += 1
+            state['cache'].clear()
+        return state['generation']
+
+def cached_response(state: Dict, key: str, build) -> Tuple[str, bytes]:
+    """(etag, corps JSON) depuis le cache LRU, sinon calculés via build() puis mémorisés."""
+    gen = refresh_generation(state)
+    with state['lock']:
+        hit = state['cache'].get(key)
+        if hit is not None:
+            state['cache'].move_to_end(key)
+            return hit
+    body = json.dumps(build(), ensure_ascii=False, default=str).encode('utf-8')
+    h = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    out = (f'W/"{state["boot"]}-{gen}-{h}"', body)
+    with state['lock']:
+        if state['generation'] == gen:
+            state['cache'][key] = out
+            while len(state['cache']) > state['cache_size']:
+                state['cache'].popitem(last=False)
+    return out
+
+# -----------------------------------------------------------------------------
+# Serveur HTTP
+# -----------------------------------------------------------------------------
+def make_handler(state: Dict):
+    table = state['table']
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: bytes = b'', etag: Optional[str] = None):
+            self.send_response(status)
+            if etag:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+            if body:
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def _error(self, status: int, msg: str):
+            self._send(status, json.dumps({'error': msg}, ensure_ascii=False).encode('utf-8'))
+
+        def do_GET(self):
+            u = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(u.query).items()}
+            parts = [p for p in u.path.split('/') if p]
+            try:
+                if parts == ['health']:
+                    return self._send(200, b'{"status": "ok"}')
+                # la base n'est interrogée qu'en cas d'absence du cache (build)
+                if parts == ['categories']:
+                    query = lambda conn: query_categories(conn, table)  # noqa: E731
+                elif parts == ['listings']:
+                    query = lambda conn: query_listings(conn, table, params)  # noqa: E731
+                elif len(parts) == 2 and parts[0] == 'listings' and parts[1].isdigit():
+                    ad_id = int(parts[1])
+
+                    def query(conn):
+                        found = query_listing(conn, table, ad_id)
+                        if found is None:
+                            raise LookupError('annonce introuvable')   # 404, jamais mis en cache
+                        return found
+                else:
+                    return self._error(404, 'route inconnue')
+
+                def build():
+                    with pooled_conn(state) as conn:
+                        return query(conn)
+
+                key = u.path + '?' + urlencode(sorted(params.items()))
+                etag, body = cached_response(state, key, build)
+                if self.headers.get('If-None-Match') == etag:
+                    return self._send(304, etag=etag)
+                return self._send(200, body, etag=etag)
+            except LookupError as e:
+                return self._error(404, str(e))
+            except ValueError as e:
+                return self._error(400, str(e))
+            except sqlite3.Error as e:
+                return self._error(503, f"base indisponible : {e}")
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+def serve(db_path: str = "coinafrique.db", table: str = "annonces", host: str = "127.0.0.1", port: int = 8765):
+    """Démarre le serveur (bloquant). Un thread par requête, pool de connexions SQLite en lecture seule."""
+    if not Path(db_path).is_file():
+        raise SystemExit(f"Base introuvable : {db_path} (le stockage partitionné n'est pas servi par l'API).")
+    state = new_state(db_path, table)
+    httpd = ThreadingHTTPServer((host, port), make_handler(state))
+    print(f"API annonces sur http://{host}:{port} (base: {db_path}, table: {table})")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        close_state(state)
+
+__all__ = [
+    "query_listings",
+    "new_state",
+    "make_handler",
+    "serve",
+]
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="API JSON lecture seule sur la base des annonces")
+    ap.add_argument('--db', default='coinafrique.db')
+    ap.add_argument('--table', default='annonces')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8765)
+    a = ap.parse_args()
+    serve(a.db, a.table, a.host, a.port)
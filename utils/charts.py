@@ -7,21 +7,29 @@ def _ensure_category(df: pd.DataFrame) -> pd.DataFrame:
         df = df.copy(); df['category'] = 'Inconnu'
     return df
 
+def _float_price(df: pd.DataFrame) -> pd.DataFrame:
+    # Int64 nullable (frames compacts) -> float pour plotly
+    if 'price_cfa' in df.columns and str(df['price_cfa'].dtype) == 'Int64':
+        df = df.copy(); df['price_cfa'] = df['price_cfa'].astype('float64')
+    return df
+
 def chart_price_hist(df: pd.DataFrame):
+    df = _float_price(df)
     return px.histogram(df, x='price_cfa', nbins=40, title='Distribution des prix (CFA)')
 
 def chart_price_by_category(df: pd.DataFrame):
-    df = _ensure_category(df)
-    g = df.groupby('category', dropna=False)['price_cfa'].median().reset_index()
+    df = _float_price(_ensure_category(df))
+    g = df.groupby('category', dropna=False, observed=True)['price_cfa'].median().reset_index()
     g = g.sort_values('price_cfa', ascending=False)
     return px.bar(g, x='category', y='price_cfa', title='Prix médian par catégorie (CFA)')
 
 def chart_top_cities(df: pd.DataFrame, topn: int = 15):
-    g = df['city'].fillna('N/A').value_counts().reset_index().head(topn)
+    g = df['city'].astype(object).fillna('N/A').value_counts().reset_index().head(topn)
     g.columns = ['city','count']
-    return px.bar(g, x='city', y='count', title=f'Top {topn} villes (compte annonces)')
+    return px.bar(g, x='city', y='count', title=f'Top {topn} localités — quartier ou ville (compte annonces)')
 
 def chart_price_bins(df: pd.DataFrame):
+    df = _float_price(df)
     if df['price_cfa'].notna().any():
         bins = [0, 50000, 100000, 200000, 300000, 500000, 1000000, df['price_cfa'].max()]
     else:
@@ -34,3 +42,15 @@ def chart_price_bins(df: pd.DataFrame):
     g = s.value_counts().reindex(labels).reset_index()
     g.columns = ['bin','count']
     return px.bar(g, x='bin', y='count', title='Répartition par tranches de prix (CFA)')
+
+def chart_price_bands(bands: pd.DataFrame, by: str = 'city', topn: int = 15):
+    """Bandes p10–p90 autour de la médiane, à partir des quantiles des sketches (sketches.price_bands)."""
+    if by == 'week':
+        g = bands.melt(id_vars=['week'], value_vars=['p10', 'p50', 'p90'], var_name='quantile', value_name='price_cfa')
+        return px.line(g, x='week', y='price_cfa', color='quantile', markers=True,
+                       title='Prix par semaine : p10 / médiane / p90 (CFA)')
+    g = bands.head(topn).copy()
+    g['err_plus'] = g['p90'] - g['p50']
+    g['err_minus'] = g['p50'] - g['p10']
+    return px.bar(g, x=by, y='p50', error_y='err_plus', error_y_minus='err_minus', hover_data=['n', 'p10', 'p90'],
+                  title=f'Prix médian et bande p10–p90 par {"localité" if by == "city" else by} (CFA)')
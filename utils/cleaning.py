@@ -2,40 +2,46 @@
 import re
 import pandas as pd
 
+from utils.gazetteer import normalize_address
+
 PRICE_RE = re.compile(r'(\d[\d\s\.,]*)', re.I)
 
+def price_to_int(txt):
+    if txt is None:
+        return None
+    s = str(txt)
+    m = PRICE_RE.search(s)
+    if not m:
+        return None
+    digits = m.group(1).replace(' ','').replace(' ','').replace(',','').replace('.','')
+    try:
+        return int(digits)
+    except Exception:
+        return None
+
+def extract_city(addr):
+    # lieu le plus précis reconnu par le gazetteer ("Grand Yoff, Dakar" -> "Grand Yoff"), mémorisé par adresse
+    if addr is None or (isinstance(addr, float) and pd.isna(addr)):
+        return None
+    return normalize_address(str(addr))[0]
+
 def basic_cleaning(df_raw: pd.DataFrame, dropna_thresh: float = 0.0, drop_duplicates: bool = False) -> pd.DataFrame:
     df = df_raw.copy()
 
     # prix -> price_cfa
     price_candidates = [c for c in df.columns if str(c).strip().lower() in ('price_cfa','price','prix','price_raw')]
     price_col = price_candidates[0] if price_candidates else None
-    def _to_int(txt):
-        if txt is None:
-            return None
-        s = str(txt)
-        m = PRICE_RE.search(s)
-        if not m:
-            return None
-        digits = m.group(1).replace(' ','').replace(' ','').replace(',','').replace('.','')
-        try:
-            return int(digits)
-        except Exception:
-            return None
-    df['price_cfa'] = df[price_col].apply(_to_int) if price_col is not None else None
+    df['price_cfa'] = df[price_col].apply(price_to_int) if price_col is not None else None
 
     # adresse -> city
     addr_candidates = [c for c in df.columns if str(c).strip().lower() in ('address_raw','adresse','address','location','ad__card-location')]
     addr_col = addr_candidates[0] if addr_candidates else None
-    def extract_city(addr):
-        if addr is None:
-            return None
-        s = str(addr)
-        for sep in ['•','-',' ',',','/']:
-            if sep in s:
-                return s.split(sep)[0].strip()
-        return s.strip()
-    df['city'] = df[addr_col].apply(extract_city) if addr_col is not None else None
+    if addr_col is not None:
+        # une normalisation par adresse distincte, puis simple correspondance
+        addr = df[addr_col].astype(object)
+        df['city'] = addr.map({a: extract_city(a) for a in addr.dropna().unique()})
+    else:
+        df['city'] = None
 
     # titre -> title_len
     title_candidates = [c for c in df.columns if str(c).strip().lower() in ('title','nom','name','details','detail','ad__card-description')]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import io
+import csv
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Aperçu paginé des gros CSV (index des offsets en fichier annexe, lecture par fenêtre)
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+INDEX_DIR = ROOT / 'data' / 'raw' / 'csv_index'
+STRIDE = 1000                   # un offset mémorisé toutes les STRIDE lignes
+
+def _index_path(path: Path) -> Path:
+    key = hashlib.sha1(str(Path(path).resolve()).encode('utf-8')).hexdigest()[:16]
+    return INDEX_DIR / f"{Path(path).stem}.{key}.json"
+
+def _iter_records(f, start_offset: int):
+    """
+    Parcourt les enregistrements CSV à partir d'un offset (binaire), en tenant compte des
+    champs entre guillemets contenant des retours à la ligne.
+    Produit (offset_début, offset_fin) de chaque enregistrement.
+    """
+    f.seek(start_offset)
+    pos = start_offset
+    rec_start = pos
+    in_quotes = False
+    for line in iter(f.readline, b''):
+        pos += len(line)
+        if line.count(b'"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            if line.strip():
+                yield rec_start, pos
+            rec_start = pos
+
+def build_index(path: Path) -> Dict:
+    """Scan unique du fichier : longueur de l'en-tête, nb de lignes, offsets tous les STRIDE."""
+    path = Path(path)
+    st_ = path.stat()
+    with open(path, 'rb') as f:
+        header = f.readline()
+        while header.count(b'"') % 2:          # en-tête multi-lignes (rare)
+            nxt = f.readline()
+            if not nxt:
+                break
+            header += nxt
+        offsets: List[int] = []
+        n = 0
+        for rec_start, _end in _iter_records(f, len(header)):
+            if n % STRIDE == 0:
+                offsets.append(rec_start)
+            n += 1
+    return {
+        'mtime': st_.st_mtime, 'size': st_.st_size,
+        'header_len': len(header), 'rows': n, 'stride': STRIDE, 'offsets': offsets,
+    }
+
+def get_index(path: Path) -> Dict:
+    """Index annexe (data/raw/csv_index), recalculé seulement si mtime/taille du CSV ont changé."""
+    path = Path(path)
+    st_ = path.stat()
+    ip = _index_path(path)
+    try:
+        idx = json.loads(ip.read_text(encoding='utf-8'))
+        if idx.get('mtime') == st_.st_mtime and idx.get('size') == st_.st_size and idx.get('stride') == STRIDE:
+            return idx
+    except Exception:
+        pass
+    idx = build_index(path)
+    try:
+        ip.parent.mkdir(parents=True, exist_ok=True)
+        ip.write_text(json.dumps(idx), encoding='utf-8')
+    except Exception:
+        pass
+    return idx
+
+def header_columns(path: Path, idx: Optional[Dict] = None) -> List[str]:
+    idx = idx or get_index(path)
+    with open(path, 'rb') as f:
+        head = f.read(idx['header_len']).decode('utf-8-sig', errors='replace')
+    return next(csv.reader(io.StringIO(head)), [])
+
+def shape(path: Path):
+    """(nb lignes, nb colonnes) sans charger le fichier."""
+    idx = get_index(path)
+    return idx['rows'], len(header_columns(path, idx))
+
+def read_window(path: Path, start: int = 0, nrows: int = 100) -> pd.DataFrame:
+    """
+    Lit uniquement les lignes [start, start + nrows) : seek sur l'offset mémorisé le plus proche,
+    saut des quelques lignes restantes, puis parsing pandas de la seule fenêtre.
+    """
+    path = Path(path)
+    idx = get_index(path)
+    start = max(0, min(int(start), idx['rows']))
+    if nrows <= 0 or start >= idx['rows']:
+        return pd.DataFrame(columns=header_columns(path, idx))
+
+    stride = idx['stride']
+    cp = start // stride
+    chunks: List[bytes] = []
+    with open(path, 'rb') as f:
+        header = f.read(idx['header_len'])
+        row = cp * stride
+        begin = end = None
+        for rec_start, rec_end in _iter_records(f, idx['offsets'][cp]):
+            if row == start:
+                begin = rec_start
+            row += 1
+            end = rec_end
+            if row >= start + nrows:
+                break
+        if begin is not None:
+            f.seek(begin)
+            chunks.append(f.read(end - begin))
+    data = header + (b'' if header.endswith(b'\n') else b'\n') + b''.join(chunks)
+    return pd.read_csv(io.BytesIO(data), encoding='utf-8-sig')
+
+__all__ = [
+    "get_index",
+    "shape",
+    "read_window",
+]
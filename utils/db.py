@@ -5,6 +5,8 @@ from pathlib import Path
 from contextlib import contextmanager
 from typing import List, Dict, Any
 
+from utils.links import canonicalize_link
+
 ROOT = Path(__file__).resolve().parents[1]
 DB_PATH = ROOT / 'db' / 'app.db'
 
@@ -17,12 +19,69 @@ CREATE TABLE IF NOT EXISTS raw_listings (
     price_raw TEXT,
     address_raw TEXT,
     image_url TEXT,
-    link TEXT UNIQUE,
+    link TEXT,
+    ad_id INTEGER,
     page INTEGER,
     scraped_at TEXT DEFAULT (CURRENT_TIMESTAMP)
 );
 """
 
+RAW_COLS = ['id', 'source', 'category', 'title', 'price_raw', 'address_raw',
+            'image_url', 'link', 'page', 'scraped_at']
+
+def ensure_ad_id_key(conn, table: str) -> None:
+    """
+    Clé de dédoublonnage = ad_id (entier extrait du lien) au lieu du texte complet du lien.
+      - ajoute la colonne ad_id si absente, canonicalise les liens et remplit ad_id
+      - supprime les doublons d'une même annonce (on garde le plus ancien id)
+      - index UNIQUE sur ad_id ; index UNIQUE partiel sur link pour les lignes sans ad_id
+    Le lien complet reste stocké (le slug du titre ne se déduit pas de l'ad_id et sert aux
+    revisites) : la clé est plus compacte, pas la table.
+    Idempotent : ne fait rien si l'index ad_id existe déjà.
+    """
+    idx = f"idx_{table}_ad_id_unique"
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name=?;", (idx,)).fetchone():
+        return
+
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table});")]
+    if 'ad_id' not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN ad_id INTEGER;")
+
+    keep: Dict[int, int] = {}
+    updates, dupes = [], []
+    for row_id, link in conn.execute(f"SELECT id, link FROM {table} ORDER BY id;").fetchall():
+        canon, ad_id = canonicalize_link(link)
+        if ad_id is None:
+            continue
+        if ad_id in keep:
+            dupes.append((row_id,))
+        else:
+            keep[ad_id] = row_id
+            updates.append((canon, ad_id, row_id))
+    conn.executemany(f"DELETE FROM {table} WHERE id=?;", dupes)
+    conn.execute(f"DROP INDEX IF EXISTS idx_{table}_link_unique;")
+    conn.executemany(f"UPDATE {table} SET link=?, ad_id=? WHERE id=?;", updates)
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {idx} ON {table}(ad_id);")
+    conn.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_link_noid ON {table}(link) WHERE ad_id IS NULL;"
+    )
+    conn.commit()
+
+def _migrate_raw(conn) -> None:
+    """Anciennes bases : 'link TEXT UNIQUE' (index texte implicite) -> table reconstruite sans."""
+    uniques = [r for r in conn.execute("PRAGMA index_list(raw_listings);") if r[3] == 'u']
+    if uniques:
+        cols = ", ".join(RAW_COLS)
+        conn.executescript(f"""
+            BEGIN;
+            ALTER TABLE raw_listings RENAME TO raw_listings_old;
+            {DDL_RAW}
+            INSERT INTO raw_listings ({cols}) SELECT {cols} FROM raw_listings_old;
+            DROP TABLE raw_listings_old;
+            COMMIT;
+        """)
+    ensure_ad_id_key(conn, 'raw_listings')
+
 @contextmanager
 def connect_db():
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -30,6 +89,7 @@ def connect_db():
     try:
         conn.execute('PRAGMA foreign_keys = ON;')
         conn.execute(DDL_RAW)
+        _migrate_raw(conn)
         yield conn
         conn.commit()
     finally:
@@ -59,13 +119,14 @@ def insert_raw_many(rows: List[Dict[str, Any]]) -> int:
             if not isinstance(r, dict):
                 raise TypeError(f"insert_raw_many: each row must be Dict, got {type(r).__name__}")
             try:
+                link, ad_id = canonicalize_link(r.get('link'))
                 cur.execute(
                     "INSERT OR IGNORE INTO raw_listings "
-                    "(source, category, title, price_raw, address_raw, image_url, link, page) "
-                    "VALUES (?,?,?,?,?,?,?,?)",
+                    "(source, category, title, price_raw, address_raw, image_url, link, ad_id, page) "
+                    "VALUES (?,?,?,?,?,?,?,?,?)",
                     (
                         r.get('source'), r.get('category'), r.get('title'), r.get('price_raw'),
-                        r.get('address_raw'), r.get('image_url'), r.get('link'), r.get('page')
+                        r.get('address_raw'), r.get('image_url'), link, ad_id, r.get('page')
                     )
                 )
                 inserted += cur.rowcount
@@ -93,9 +154,11 @@ def upsert_raw_many_counts(rows: List[Dict[str, Any]]) -> Dict[str, int]:
             if not isinstance(r, dict):
                 raise TypeError(f"upsert_raw_many_counts: each row must be Dict, got {type(r).__name__}")
             try:
-                link = r.get('link')
+                link, ad_id = canonicalize_link(r.get('link'))
                 if not link:
                     continue
+                # clé : ad_id si disponible, sinon le lien canonique
+                key_sql, key_val = ('ad_id=?', ad_id) if ad_id is not None else ('link=? AND ad_id IS NULL', link)
 
                 # 1) UPDATE (écrasement)
                 cur.execute(
@@ -106,12 +169,13 @@ def upsert_raw_many_counts(rows: List[Dict[str, Any]]) -> Dict[str, int]:
                          price_raw=?,
                          address_raw=?,
                          image_url=?,
+                         link=?,
                          page=?,
                          scraped_at=CURRENT_TIMESTAMP
-                       WHERE link=?""",
+                       WHERE """ + key_sql,
                     (
                         r.get('source'), r.get('category'), r.get('title'), r.get('price_raw'),
-                        r.get('address_raw'), r.get('image_url'), r.get('page'), link
+                        r.get('address_raw'), r.get('image_url'), link, r.get('page'), key_val
                     )
                 )
                 if cur.rowcount == 1:
@@ -121,11 +185,11 @@ def upsert_raw_many_counts(rows: List[Dict[str, Any]]) -> Dict[str, int]:
                 # 2) INSERT si absent
                 cur.execute(
                     """INSERT INTO raw_listings
-                         (source, category, title, price_raw, address_raw, image_url, link, page, scraped_at)
-                       VALUES (?,?,?,?,?,?,?,?,CURRENT_TIMESTAMP)""",
+                         (source, category, title, price_raw, address_raw, image_url, link, ad_id, page, scraped_at)
+                       VALUES (?,?,?,?,?,?,?,?,?,CURRENT_TIMESTAMP)""",
                     (
                         r.get('source'), r.get('category'), r.get('title'), r.get('price_raw'),
-                        r.get('address_raw'), r.get('image_url'), link, r.get('page')
+                        r.get('address_raw'), r.get('image_url'), link, ad_id, r.get('page')
                     )
                 )
                 ins += 1
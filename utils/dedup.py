@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+import zlib
+import math
+import hashlib
+import sqlite3
+import unicodedata
+from typing import Optional, List, Dict, Iterable, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.cleaning import price_to_int, extract_city
+
+# -----------------------------------------------------------------------------
+# Quasi-doublons (reposts) : MinHash + LSH par bandes
+# -----------------------------------------------------------------------------
+NUM_PERM = 64
+BANDS = 16                      # 16 bandes x 4 lignes : seuil implicite ~ (1/16)^(1/4) = 0.5
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.7                 # similarité de Jaccard estimée pour confirmer un candidat
+FIELD_WEIGHT = 4                # prix / ville / image répétés : pèsent face aux trigrammes du titre
+MERSENNE = np.uint64(4294967291)  # premier < 2^32 : a*h tient dans un uint64
+ASSIGN_BATCH = 20_000           # lignes par passe groupée (mémoire bornée)
+MAX_BUCKET_CANDIDATES = 32      # entrées au plus par seau LSH (seaux très peuplés plafonnés)
+
+_rng = np.random.RandomState(20240501)   # graine fixe : signatures stables entre exécutions
+_A = _rng.randint(1, 2**31 - 1, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2**31 - 1, size=NUM_PERM).astype(np.uint64)
+
+def _norm_text(s) -> str:
+    s = unicodedata.normalize('NFKD', str(s or '')).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', s.lower()).strip()
+
+def _image_token(url) -> Optional[str]:
+    """thumb_4739575_uploaded_image1_1715527231.jpg -> uploaded_image1_1715527231 (sans l'ID d'annonce)."""
+    if not url:
+        return None
+    name = str(url).rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    return re.sub(r'^thumb_\d+_', '', name) or None
+
+def listing_tokens(title, price, city, image_url) -> Set[str]:
+    """
+    Ensemble de caractéristiques d'une annonce :
+      - trigrammes de caractères du titre normalisé
+      - prix arrondi sur une échelle log (~10 %), ville normalisée, identifiant d'image
+        (chacun répété FIELD_WEIGHT fois)
+    """
+    toks: Set[str] = set()
+
+    def add_field(tok: str) -> None:
+        toks.update(f"{tok}#{k}" for k in range(FIELD_WEIGHT))
+
+    t = _norm_text(title)
+    if t:
+        padded = f" {t} "
+        toks.update(padded[i:i + 3] for i in range(max(len(padded) - 2, 1)))
+    p = price if isinstance(price, (int, float)) and not pd.isna(price) else price_to_int(price)
+    if p:
+        add_field(f"p:{round(math.log(max(float(p), 1.0)) / math.log(1.1))}")
+    c = _norm_text(city)
+    if c:
+        add_field(f"c:{c}")
+    img = _image_token(image_url)
+    if img:
+        add_field(f"i:{img}")
+    return toks
+
+def minhash_signature(tokens: Iterable[str]) -> np.ndarray:
+    """Signature MinHash (NUM_PERM valeurs uint64) d'un ensemble de tokens."""
+    h = np.fromiter((zlib.crc32(t.encode('utf-8')) for t in tokens), dtype=np.uint64)
+    if h.size == 0:
+        return np.full(NUM_PERM, MERSENNE, dtype=np.uint64)
+    h %= MERSENNE
+    vals = ((_A[:, None] * h[None, :]) % MERSENNE + _B[:, None]) % MERSENNE
+    return vals.min(axis=1)
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """Clé (int64 stable) de chaque bande de la signature."""
+    out = []
+    for b in range(BANDS):
+        d = hashlib.blake2b(sig[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=8).digest()
+        out.append(int.from_bytes(d, 'little', signed=True))
+    return out
+
+def similarity(s1: np.ndarray, s2: np.ndarray) -> float:
+    """Jaccard estimée = part des minima égaux."""
+    return float(np.mean(s1 == s2))
+
+# -----------------------------------------------------------------------------
+# En mémoire : identifiants de cluster pour un DataFrame (dashboard)
+# -----------------------------------------------------------------------------
+def _first_col(df: pd.DataFrame, names) -> Optional[str]:
+    for c in df.columns:
+        if str(c).strip().lower() in names:
+            return c
+    return None
+
+def _matches(sig: np.ndarray, cands: List[np.ndarray], threshold: float) -> np.ndarray:
+    """Indices des candidats dont la similarité avec sig atteint le seuil (comparaison vectorisée)."""
+    if not cands:
+        return np.empty(0, dtype=np.int64)
+    hits = (np.vstack(cands) == sig).sum(axis=1) >= threshold * NUM_PERM
+    return np.flatnonzero(hits)
+
+def cluster_signatures(sigs: List[np.ndarray], threshold: float = THRESHOLD) -> List[int]:
+    """
+    Union-find LSH sur une liste de signatures -> racine (plus petit indice) de chacune.
+    Un seul représentant par cluster et par seau, au plus MAX_BUCKET_CANDIDATES :
+    un seau très peuplé ne rend pas la passe quadratique.
+    Signature vide (aucune caractéristique) : cluster à elle seule, hors bandes.
+    """
+    parent = list(range(len(sigs)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets: Dict[tuple, List[int]] = {}
+    for i, sig in enumerate(sigs):
+        if (sig == MERSENNE).all():
+            continue
+        keys = [(b, key) for b, key in enumerate(band_keys(sig))]
+        reps: Dict[int, int] = {}
+        for k in keys:
+            for j in buckets.get(k, ()):
+                reps.setdefault(find(j), j)
+        cands = list(reps.values())
+        for m in _matches(sig, [sigs[j] for j in cands], threshold):
+            ri, rj = find(i), find(cands[m])
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+        root = find(i)
+        for k in keys:
+            members = buckets.setdefault(k, [])
+            if len(members) < MAX_BUCKET_CANDIDATES and all(find(j) != root for j in members):
+                members.append(i)
+    return [find(i) for i in range(len(sigs))]
+
+def cluster_frame(df: pd.DataFrame, threshold: float = THRESHOLD) -> pd.Series:
+    """
+    Identifiant de cluster (quasi-doublons) par ligne, en temps ~linéaire :
+    chaque ligne ne se compare qu'aux représentants des clusters partageant une bande LSH.
+    Ligne sans aucune caractéristique (détail en échec…) : cluster à elle seule, hors bandes.
+    """
+    if df is None or df.empty:
+        return pd.Series(dtype='int64')
+    title_col = _first_col(df, ('title', 'nom', 'name', 'details', 'detail'))
+    price_col = _first_col(df, ('price_cfa', 'price_raw', 'prix', 'price'))
+    city_col = _first_col(df, ('city',))
+    img_col = _first_col(df, ('image_url', 'image_lien'))
+
+    def col(c):
+        return df[c].tolist() if c is not None else [None] * len(df)
+
+    sigs = [minhash_signature(listing_tokens(t, p, c, im))
+            for t, p, c, im in zip(col(title_col), col(price_col), col(city_col), col(img_col))]
+    return pd.Series(cluster_signatures(sigs, threshold), index=df.index, dtype='int64')
+
+# -----------------------------------------------------------------------------
+# Persistant (SQLite) : affectation incrémentale des nouvelles lignes
+# -----------------------------------------------------------------------------
+DDL_DUP = """
+CREATE TABLE IF NOT EXISTS dup_signatures (
+    tbl TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    cluster_id INTEGER NOT NULL,
+    sig BLOB NOT NULL,
+    PRIMARY KEY (tbl, row_id)
+);
+CREATE INDEX IF NOT EXISTS idx_dup_signatures_cluster ON dup_signatures(tbl, cluster_id);
+CREATE TABLE IF NOT EXISTS dup_buckets (
+    tbl TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    row_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dup_buckets_key ON dup_buckets(tbl, band, bucket);
+CREATE INDEX IF NOT EXISTS idx_dup_buckets_row ON dup_buckets(tbl, row_id);
+"""
+
+def ensure_dup_tables(conn) -> None:
+    # instruction par instruction (executescript validerait la transaction en cours)
+    for stmt in DDL_DUP.split(';'):
+        if stmt.strip():
+            conn.execute(stmt)
+
+def _assign(conn, table: str, rows, threshold: float) -> Dict[str, int]:
+    """
+    Signature + bandes de chaque ligne (id, title, price_raw, address_raw, image_url) et
+    affectation d'un cluster_id : celui des candidats LSH confirmés (fusion des clusters si
+    plusieurs), sinon son propre id. Passe par lot : les seaux concernés sont lus en une
+    requête, l'affectation se fait en mémoire, puis écriture groupée.
+    Un représentant par cluster et par seau, comparés d'un bloc ; la ligne n'entre que dans
+    les seaux où son cluster n'est pas déjà représenté et qui comptent moins de
+    MAX_BUCKET_CANDIDATES entrées (seaux très peuplés plafonnés).
+    """
+    stats = {'processed': 0, 'matched': 0}
+    prepared = []
+    for row_id, title, price_raw, address_raw, image_url in rows:
+        toks = listing_tokens(title, price_raw, extract_city(address_raw), image_url)
+        sig = minhash_signature(toks)
+        prepared.append((row_id, sig, list(enumerate(band_keys(sig))) if toks else []))
+    if not prepared:
+        return stats
+
+    # seaux concernés par le lot : un représentant (signature) par cluster + nb d'entrées ;
+    # CROSS JOIN fixe l'ordre des boucles (seaux sondés d'abord, par l'index idx_dup_buckets_key)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS dup_probe "
+                 "(band INTEGER, bucket INTEGER, PRIMARY KEY (band, bucket)) WITHOUT ROWID;")
+    conn.execute("DELETE FROM dup_probe;")
+    conn.executemany("INSERT INTO dup_probe (band, bucket) VALUES (?, ?);",
+                     list({k for _, _, keys in prepared for k in keys}))
+    buckets: Dict[tuple, Dict[int, np.ndarray]] = {}
+    size: Dict[tuple, int] = {}
+    for b, key, cluster, sig, n in conn.execute(
+        "SELECT q.band, q.bucket, s.cluster_id, MIN(s.sig), COUNT(*) FROM dup_probe q "
+        "CROSS JOIN dup_buckets k ON k.tbl = ? AND k.band = q.band AND k.bucket = q.bucket "
+        "CROSS JOIN dup_signatures s ON s.tbl = k.tbl AND s.row_id = k.row_id "
+        "GROUP BY q.band, q.bucket, s.cluster_id;", (table,)
+    ):
+        buckets.setdefault((b, key), {})[cluster] = np.frombuffer(sig, dtype=np.uint64)
+        size[(b, key)] = size.get((b, key), 0) + n
+
+    parent: Dict[int, int] = {}     # fusions de clusters (anciens et nouveaux)
+
+    def find(c: int) -> int:
+        while parent.get(c, c) != c:
+            parent[c] = parent.get(parent[c], parent[c])
+            c = parent[c]
+        return c
+
+    sig_rows, bucket_rows = [], []
+    for row_id, sig, keys in prepared:
+        reps: Dict[int, np.ndarray] = {}
+        for k in keys:
+            if k in buckets:
+                # seau ré-indexé par cluster courant : les clusters fusionnés n'y comptent qu'une fois
+                buckets[k] = {find(c): cand for c, cand in buckets[k].items()}
+                for c, cand in buckets[k].items():
+                    reps.setdefault(c, cand)
+        ids = list(reps)
+        clusters = {ids[m] for m in _matches(sig, list(reps.values()), threshold)}
+        cluster_id = min(clusters | {row_id})
+        for c in clusters:
+            if c != cluster_id:
+                parent[c] = cluster_id
+        sig_rows.append((row_id, cluster_id, sig))
+        merged = clusters | {cluster_id}
+        for k in keys:
+            members = buckets.setdefault(k, {})
+            if size.get(k, 0) < MAX_BUCKET_CANDIDATES and not members.keys() & merged:
+                members[cluster_id] = sig
+                size[k] = size.get(k, 0) + 1
+                bucket_rows.append((table, k[0], k[1], row_id))
+        stats['processed'] += 1
+        stats['matched'] += int(bool(clusters))
+
+    conn.executemany(
+        "UPDATE dup_signatures SET cluster_id = ? WHERE tbl = ? AND cluster_id = ?;",
+        [(find(c), table, c) for c in parent]
+    )
+    conn.executemany(
+        "INSERT INTO dup_signatures (tbl, row_id, cluster_id, sig) VALUES (?, ?, ?, ?);",
+        [(table, row_id, find(c), sig.tobytes()) for row_id, c, sig in sig_rows]
+    )
+    conn.executemany("INSERT INTO dup_buckets (tbl, band, bucket, row_id) VALUES (?, ?, ?, ?);", bucket_rows)
+    return stats
+
+def assign_new(conn, table: str = "annonces", threshold: float = THRESHOLD) -> Dict[str, int]:
+    """
+    Affecte un cluster aux lignes dont l'id dépasse le dernier id traité, par lots de
+    ASSIGN_BATCH lignes. Sur la connexion ouverte, dans la transaction de l'appelant
+    (_insert_rows, fin de chargement en masse).
+    Ligne sans caractéristique : son propre cluster, jamais rangée dans les bandes.
+    Retourne {'processed': X, 'matched': Y}.
+    """
+    ensure_dup_tables(conn)
+    stats = {'processed': 0, 'matched': 0}
+    while True:
+        last_id = conn.execute("SELECT COALESCE(MAX(row_id), 0) FROM dup_signatures WHERE tbl = ?;",
+                               (table,)).fetchone()[0]
+        new_rows = conn.execute(
+            f"SELECT id, title, price_raw, address_raw, image_url FROM {table} "
+            f"WHERE id > ? ORDER BY id LIMIT ?;", (last_id, ASSIGN_BATCH)
+        ).fetchall()
+        if not new_rows:
+            return stats
+        for k, v in _assign(conn, table, new_rows, threshold).items():
+            stats[k] += v
+
+def reassign(conn, table: str, ids, threshold: float = THRESHOLD) -> Dict[str, int]:
+    """
+    Recalcule signature, bandes et cluster de lignes déjà traitées dont le titre, le prix,
+    l'adresse ou l'image ont changé (utils.enrichment, utils.freshness) ; les ids au-delà du
+    dernier id traité sont laissés à assign_new.
+    """
+    ensure_dup_tables(conn)
+    last_id = conn.execute("SELECT COALESCE(MAX(row_id), 0) FROM dup_signatures WHERE tbl = ?;",
+                           (table,)).fetchone()[0]
+    ids = sorted({int(i) for i in ids if int(i) <= last_id})
+    if not ids:
+        return {'processed': 0, 'matched': 0}
+    marks = ', '.join('?' * len(ids))
+    conn.execute(f"DELETE FROM dup_buckets WHERE tbl = ? AND row_id IN ({marks});", (table, *ids))
+    conn.execute(f"DELETE FROM dup_signatures WHERE tbl = ? AND row_id IN ({marks});", (table, *ids))
+    rows = conn.execute(
+        f"SELECT id, title, price_raw, address_raw, image_url FROM {table} "
+        f"WHERE id IN ({marks}) ORDER BY id;", ids
+    ).fetchall()
+    return _assign(conn, table, rows, threshold)
+
+def assign_clusters_sqlite(
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    threshold: float = THRESHOLD,
+) -> Dict[str, int]:
+    """assign_new sur sa propre connexion (rattrapage d'une base existante)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            return assign_new(conn, table, threshold)
+    finally:
+        conn.close()
+
+def count_unique(conn, table: str = "annonces", category: Optional[str] = None) -> int:
+    """
+    Nombre d'animaux uniques (clusters) ; lignes non encore traitées (ou base sans table
+    dup_signatures) comptées à part entière.
+    """
+    where, params = (" WHERE a.category = ?", [category]) if category else ("", [])
+    try:
+        q = (
+            f"SELECT COUNT(DISTINCT COALESCE(s.cluster_id, -a.id)) FROM {table} a "
+            f"LEFT JOIN dup_signatures s ON s.tbl = ? AND s.row_id = a.id{where}"
+        )
+        return int(conn.execute(q, [table] + params).fetchone()[0])
+    except sqlite3.OperationalError:
+        return int(conn.execute(f"SELECT COUNT(*) FROM {table} a{where}", params).fetchone()[0])
+
+def cluster_representatives(conn, table: str = "annonces", category: Optional[str] = None) -> Tuple[List[bytes], int]:
+    """
+    Une signature par cluster + nb de lignes sans signature (non encore traitées, ou base
+    sans table dup_signatures) : de quoi fusionner les clusters de plusieurs bases.
+    """
+    where, params = (" AND a.category = ?", [category]) if category else ("", [])
+    try:
+        reps = [r[0] for r in conn.execute(
+            f"SELECT MIN(s.sig) FROM {table} a JOIN dup_signatures s ON s.tbl = ? AND s.row_id = a.id "
+            f"WHERE 1 = 1{where} GROUP BY s.cluster_id;", [table] + params
+        )]
+        unsigned = conn.execute(
+            f"SELECT COUNT(*) FROM {table} a LEFT JOIN dup_signatures s ON s.tbl = ? AND s.row_id = a.id "
+            f"WHERE s.row_id IS NULL{where};", [table] + params
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        where = " WHERE a.category = ?" if category else ""
+        return [], int(conn.execute(f"SELECT COUNT(*) FROM {table} a{where}", params).fetchone()[0])
+    return reps, int(unsigned)
+
+def count_merged(parts: Iterable[Tuple[List[bytes], int]], threshold: float = THRESHOLD) -> int:
+    """
+    Animaux uniques sur plusieurs bases (utils.partitions) : les représentants de cluster de
+    chaque base sont regroupés par LSH (un repost d'un mois sur l'autre ne compte qu'une fois),
+    les lignes sans signature comptent chacune pour un.
+    """
+    sigs: List[np.ndarray] = []
+    unsigned = 0
+    for reps, n in parts:
+        sigs += [np.frombuffer(b, dtype=np.uint64) for b in reps]
+        unsigned += n
+    return len(set(cluster_signatures(sigs, threshold))) + unsigned
+
+__all__ = [
+    "cluster_signatures",
+    "cluster_frame",
+    "assign_new",
+    "reassign",
+    "assign_clusters_sqlite",
+    "count_unique",
+    "cluster_representatives",
+    "count_merged",
+]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import time
+import sqlite3
+from typing import Optional, List, Dict, Iterable, Tuple
+
+import utils.scraping_bs as scraping
+import utils.sketches as sketches
+import utils.dedup as dedup
+from utils.cleaning import extract_city
+
+# -----------------------------------------------------------------------------
+# File de reprise des DÉTAILS en échec / incomplets
+# -----------------------------------------------------------------------------
+QUEUE_TABLE = 'enrich_queue'
+DETAIL_FIELDS = ('title', 'price_raw', 'address_raw', 'image_url')
+
+BASE_DELAY_SEC = 300            # 1re reprise après 5 min, puis x2 à chaque échec
+MAX_DELAY_SEC = 24 * 3600
+MAX_ATTEMPTS = 6                # au-delà, le lien est retiré de la file
+
+DDL_QUEUE = f"""
+CREATE TABLE IF NOT EXISTS {QUEUE_TABLE} (
+    link TEXT NOT NULL,
+    tbl TEXT NOT NULL,
+    category TEXT,
+    missing TEXT,
+    attempts INTEGER DEFAULT 0,
+    next_try_at REAL DEFAULT 0,
+    last_error TEXT,
+    PRIMARY KEY (tbl, link)
+);
+"""
+
+def ensure_queue(conn) -> None:
+    conn.execute(DDL_QUEUE)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{QUEUE_TABLE}_due ON {QUEUE_TABLE}(tbl, next_try_at);")
+
+def _missing_fields(row: Dict) -> List[str]:
+    return [f for f in DETAIL_FIELDS if not row.get(f)]
+
+def backoff_delay(attempts: int) -> float:
+    """Délai avant la prochaine tentative (exponentiel, plafonné)."""
+    return float(min(BASE_DELAY_SEC * (2 ** max(attempts - 1, 0)), MAX_DELAY_SEC))
+
+def enqueue_incomplete(conn, rows: Iterable[Dict], table: str = "annonces") -> int:
+    """
+    Met en file les lignes dont le DÉTAIL a échoué ou est partiel (champs vides).
+    Une ligne déjà en file garde son compteur de tentatives.
+    Retourne le nombre de liens mis en file.
+    """
+    ensure_queue(conn)
+    params = []
+    for r in rows:
+        link = r.get('link')
+        missing = _missing_fields(r)
+        if not link or not missing:
+            continue
+        params.append((link, table, r.get('category'), ",".join(missing), r.get('detail_error')))
+    conn.executemany(
+        f"INSERT INTO {QUEUE_TABLE} (link, tbl, category, missing, last_error) VALUES (?, ?, ?, ?, ?) "
+        f"ON CONFLICT(tbl, link) DO UPDATE SET missing=excluded.missing, last_error=excluded.last_error;",
+        params
+    )
+    return len(params)
+
+def _due(conn, table: str, limit: int, now: float) -> List[tuple]:
+    return conn.execute(
+        f"SELECT link, category, attempts FROM {QUEUE_TABLE} "
+        f"WHERE tbl=? AND next_try_at <= ? AND attempts < ? ORDER BY next_try_at LIMIT ?;",
+        (table, now, MAX_ATTEMPTS, int(limit))
+    ).fetchall()
+
+def _fill_missing(conn, table: str, link: str, det: Dict[str, Optional[str]]) -> Tuple[List[int], List[int]]:
+    """
+    UPDATE uniquement des champs vides (les valeurs déjà présentes ne sont jamais écrasées) ;
+    city suit l'adresse complétée. Retourne (ids dont le prix vient d'être complété,
+    ids dont au moins un champ vient d'être complété).
+    """
+    sets, vals = [], []
+    for f in DETAIL_FIELDS:
+        if det.get(f):
+            sets.append(f"{f} = CASE WHEN {f} IS NULL OR {f} = '' THEN ? ELSE {f} END")
+            vals.append(det[f])
+    if not sets:
+        return [], []
+    if det.get('address_raw'):
+        # les expressions lisent les valeurs d'avant l'UPDATE : même condition que address_raw
+        sets.append("city = CASE WHEN address_raw IS NULL OR address_raw = '' THEN ? ELSE city END")
+        vals.append(extract_city(det['address_raw']))
+    empty = [f"({f} IS NULL OR {f} = '')" for f in DETAIL_FIELDS if det.get(f)]
+    touched = [r[0] for r in conn.execute(
+        f"SELECT id FROM {table} WHERE link = ? AND ({' OR '.join(empty)});", (link,)
+    )]
+    priced = [r[0] for r in conn.execute(
+        f"SELECT id FROM {table} WHERE link = ? AND (price_raw IS NULL OR price_raw = '');", (link,)
+    )] if det.get('price_raw') else []
+    conn.execute(f"UPDATE {table} SET {', '.join(sets)} WHERE link = ?;", (*vals, link))
+    return priced, touched
+
+def run_enrichment(
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    max_items: int = 200,
+    max_workers: int = 8,
+    verify_ssl: bool = True,
+) -> Dict[str, int]:
+    """
+    Passe d'enrichissement : re-télécharge uniquement les liens dus de la file et complète
+    les champs manquants. Succès complet -> sortie de file ; sinon nouvelle échéance (backoff),
+    et retrait de la file après MAX_ATTEMPTS tentatives. Les prix complétés rejoignent les sketches
+    et les lignes complétées sont réaffectées à un cluster de reposts.
+    Retourne {'due': X, 'completed': Y, 'partial': Z, 'failed': W, 'dropped': D}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    stats = {'due': 0, 'completed': 0, 'partial': 0, 'failed': 0, 'dropped': 0}
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_queue(conn)
+        # liens épuisés laissés par une version antérieure
+        stats['dropped'] = conn.execute(
+            f"DELETE FROM {QUEUE_TABLE} WHERE tbl=? AND attempts >= ?;", (table, MAX_ATTEMPTS)
+        ).rowcount
+        conn.commit()
+        now = time.time()
+        due = _due(conn, table, max_items, now)
+        stats['due'] = len(due)
+        if not due:
+            return stats
+
+        rs = scraping._requests_session_from_selenium_cookies([], verify=verify_ssl)
+
+        def fetch(item):
+            link, category, _attempts = item
+            try:
+                r = rs.get(link, timeout=12)
+                r.raise_for_status()
+                return item, scraping._parse_detail_html(r.text, category), None
+            except Exception as e:
+                return item, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            results = list(ex.map(fetch, due))
+
+        priced: List[int] = []
+        touched: List[int] = []
+        for (link, _category, attempts), det, err in results:
+            if det is not None:
+                p, t = _fill_missing(conn, table, link, det)
+                priced += p
+                touched += t
+            row = conn.execute(
+                f"SELECT {', '.join(DETAIL_FIELDS)} FROM {table} WHERE link = ?;", (link,)
+            ).fetchone()
+            missing = [f for f, v in zip(DETAIL_FIELDS, row or ()) if not v] if row else []
+            if row is None or not missing:
+                conn.execute(f"DELETE FROM {QUEUE_TABLE} WHERE tbl=? AND link=?;", (table, link))
+                stats['completed' if row is not None else 'failed'] += 1
+                continue
+            attempts += 1
+            stats['failed' if det is None else 'partial'] += 1
+            if attempts >= MAX_ATTEMPTS:
+                conn.execute(f"DELETE FROM {QUEUE_TABLE} WHERE tbl=? AND link=?;", (table, link))
+                stats['dropped'] += 1
+                continue
+            conn.execute(
+                f"UPDATE {QUEUE_TABLE} SET attempts=?, next_try_at=?, missing=?, last_error=? "
+                f"WHERE tbl=? AND link=?;",
+                (attempts, now + backoff_delay(attempts), ",".join(missing), err, table, link)
+            )
+        sketches.ingest_ids(conn, table, priced)
+        # nouveaux titre / prix / adresse / image : la ligne peut rejoindre un cluster de reposts
+        dedup.reassign(conn, table, touched)
+        conn.commit()
+    finally:
+        conn.close()
+    return stats
+
+__all__ = [
+    "enqueue_incomplete",
+    "run_enrichment",
+]
+
+if __name__ == "__main__":
+    print(run_enrichment(db_path="coinafrique.db", table="annonces"))
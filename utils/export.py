@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import sqlite3
+import zipfile
+from pathlib import Path
+from typing import Optional, List, Dict, Iterator, Tuple
+from urllib.parse import quote
+
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Export en flux : SQLite -> CSV / Parquet partitionné (mémoire constante)
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+EXPORT_DIR = ROOT / 'data' / 'raw' / 'exports'
+CHUNK_ROWS = 50_000
+
+def build_where(
+    category: Optional[List[str]] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    search: Optional[str] = None,
+) -> Tuple[str, list]:
+    """Clause WHERE paramétrée : catégories, période (scraped_at, 'YYYY-MM-DD'), recherche dans le titre."""
+    clauses, params = [], []
+    if category:
+        cats = [category] if isinstance(category, str) else list(category)
+        clauses.append(f"category IN ({','.join('?' * len(cats))})")
+        params += cats
+    if since:
+        clauses.append("scraped_at >= ?")
+        params.append(str(since))
+    if until:
+        clauses.append("scraped_at < date(?, '+1 day')")
+        params.append(str(until))
+    if search:
+        clauses.append("title LIKE ?")
+        params.append(f"%{search}%")
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def iter_chunks(conn, table: str, chunk_rows: int = CHUNK_ROWS, **filters) -> Iterator[pd.DataFrame]:
+    """Curseur SQLite lu par fetchmany : un DataFrame de chunk_rows lignes au plus à la fois."""
+    where, params = build_where(**filters)
+    cur = conn.execute(f"SELECT * FROM {table}{where} ORDER BY id;", params)
+    cols = [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield pd.DataFrame.from_records(rows, columns=cols)
+
+def export_csv(db_path: str, table: str, out_path: Path, chunk_rows: int = CHUNK_ROWS, **filters) -> int:
+    """Écrit le résultat filtré dans un CSV, morceau par morceau. Retourne le nb de lignes."""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with sqlite3.connect(db_path) as conn, open(out_path, 'w', encoding='utf-8', newline='') as f:
+        for i, df in enumerate(iter_chunks(conn, table, chunk_rows, **filters)):
+            df.to_csv(f, index=False, header=(i == 0))
+            n += len(df)
+    return n
+
+def _arrow_schema(conn, table: str, exclude=('category',)):
+    """
+    Schéma arrow fixé à partir du schéma SQLite (évite les types 'null' d'un premier lot vide).
+    La colonne de partition (category) est portée par le chemin, pas par le fichier.
+    """
+    import pyarrow as pa
+    fields = []
+    for _cid, name, decl, *_ in conn.execute(f"PRAGMA table_info({table});"):
+        if name in exclude:
+            continue
+        fields.append(pa.field(name, pa.int64() if 'INT' in (decl or '').upper() else pa.string()))
+    return pa.schema(fields)
+
+def _part_name(v) -> str:
+    # encodage URI : décodé tel quel par le partitionnement hive de pyarrow
+    return quote(str(v), safe='') if v not in (None, '') else '__HIVE_DEFAULT_PARTITION__'
+
+def export_parquet(db_path: str, table: str, out_dir: Path, chunk_rows: int = CHUNK_ROWS, **filters) -> Dict[str, int]:
+    """
+    Parquet partitionné category=<cat>/month=<YYYY-MM>/part-0.parquet (mois de scraped_at).
+    Un ParquetWriter ouvert par partition ; chaque lot est réparti puis écrit comme row group.
+    Nécessite pyarrow. Retourne {chemin_partition: nb lignes}.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Export Parquet indisponible : installez pyarrow (pip install pyarrow).")
+
+    out_dir = Path(out_dir)
+    writers: Dict[str, 'pq.ParquetWriter'] = {}
+    counts: Dict[str, int] = {}
+    try:
+        with sqlite3.connect(db_path) as conn:
+            schema = _arrow_schema(conn, table)
+            for df in iter_chunks(conn, table, chunk_rows, **filters):
+                month = df['scraped_at'].astype(str).str[:7] if 'scraped_at' in df.columns else pd.Series('', index=df.index)
+                for (cat, mon), part in df.groupby([df['category'].fillna(''), month.fillna('')], sort=False):
+                    rel = f"category={_part_name(cat)}/month={_part_name(mon)}"
+                    if rel not in writers:
+                        (out_dir / rel).mkdir(parents=True, exist_ok=True)
+                        writers[rel] = pq.ParquetWriter(out_dir / rel / 'part-0.parquet', schema)
+                    part = part.drop(columns=['category'])
+                    writers[rel].write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+                    counts[rel] = counts.get(rel, 0) + len(part)
+    finally:
+        for w in writers.values():
+            w.close()
+    return counts
+
+def zip_dir(src_dir: Path, zip_path: Path) -> Path:
+    """Archive un dossier d'export (fichier par fichier, sans tout charger en mémoire)."""
+    src_dir, zip_path = Path(src_dir), Path(zip_path)
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as z:
+        for p in sorted(src_dir.rglob('*')):
+            if p.is_file():
+                z.write(p, p.relative_to(src_dir))
+    return zip_path
+
+__all__ = [
+    "iter_chunks",
+    "export_csv",
+    "export_parquet",
+]
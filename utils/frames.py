@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from pathlib import Path
+from typing import Optional, Dict
+
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# DataFrames compacts pour les annonces (catégoriels, entiers nullables, chaînes arrow)
+# -----------------------------------------------------------------------------
+# Colonnes très répétitives -> dtype 'category'
+CATEGORICAL_COLS = {
+    'category', 'city', 'source', 'address_raw', 'adresse', 'address', 'location',
+    'web_scraper_start_url',
+}
+# Colonnes prix / compteurs -> entiers nullables
+INT_COLS = {'price_cfa', 'title_len', 'price_changes', 'ad_id', 'dup_cluster'}
+
+def _string_dtype() -> Optional[str]:
+    """'string[pyarrow]' si pyarrow est installé ; sinon None (les chaînes restent en objet :
+    le dtype 'string' pur Python ne fait pas gagner de mémoire)."""
+    try:
+        import pyarrow  # noqa: F401
+        return 'string[pyarrow]'
+    except ImportError:
+        return None
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convertit un DataFrame d'annonces en représentation compacte :
+      - colonnes répétitives (catégorie, ville, source, adresse…) en 'category'
+      - prix / compteurs en 'Int64' (entier nullable)
+      - autres colonnes texte en chaînes arrow (si pyarrow disponible)
+    """
+    if df is None or df.empty:
+        return df
+    out = df.copy()
+    str_dtype = _string_dtype()
+    for c in out.columns:
+        key = str(c).strip().lower()
+        s = out[c]
+        try:
+            if key in CATEGORICAL_COLS:
+                out[c] = s.astype('category')
+            elif key in INT_COLS:
+                out[c] = pd.to_numeric(s, errors='coerce').round().astype('Int64')
+            elif str_dtype and s.dtype == object:
+                out[c] = s.astype(str_dtype)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+def load_cleaned(paths: Dict[str, Path]) -> pd.DataFrame:
+    """
+    Concatène les CSV nettoyés {catégorie: chemin} (colonne 'category'), sans compacter :
+    l'appelant compacte une seule fois, après nettoyage (compact_frame).
+    """
+    frames = []
+    for cat, p in paths.items():
+        if p.exists():
+            try:
+                df0 = pd.read_csv(p)
+                df0['category'] = cat
+                frames.append(df0)
+            except Exception:
+                pass
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mémoire (octets, deep) par colonne : représentation objet (actuelle) vs compacte.
+    Dernière ligne 'TOTAL'.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['column', 'object_bytes', 'compact_bytes', 'ratio'])
+    as_object = df.astype(object)
+    compact = compact_frame(as_object)
+    rep = pd.DataFrame({
+        'column': list(df.columns),
+        'object_dtype': [str(as_object[c].dtype) for c in df.columns],
+        'compact_dtype': [str(compact[c].dtype) for c in df.columns],
+        'object_bytes': as_object.memory_usage(index=False, deep=True).values,
+        'compact_bytes': compact.memory_usage(index=False, deep=True).values,
+    })
+    total = pd.DataFrame([{
+        'column': 'TOTAL', 'object_dtype': '', 'compact_dtype': '',
+        'object_bytes': rep['object_bytes'].sum(), 'compact_bytes': rep['compact_bytes'].sum(),
+    }])
+    rep = pd.concat([rep, total], ignore_index=True)
+    rep['ratio'] = (rep['object_bytes'] / rep['compact_bytes'].clip(lower=1)).round(2)
+    return rep
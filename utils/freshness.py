@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import heapq
+import sqlite3
+from typing import Optional, List, Dict, Tuple, Iterator
+
+import utils.scraping_bs as scraping
+import utils.sketches as sketches
+import utils.dedup as dedup
+from utils.cleaning import extract_city
+
+# -----------------------------------------------------------------------------
+# Rafraîchissement ciblé : ne revisite que les annonces périmées
+# -----------------------------------------------------------------------------
+# Durée de vie (heures) d'une annonce avant revisite, par catégorie
+TTL_HOURS = {
+    'Chiens': 72,
+    'Moutons': 24,                 # prix très volatils (fêtes)
+    'Poules-Lapins-Pigeons': 72,
+    'Autres animaux': 120,
+}
+DEFAULT_TTL_HOURS = 72
+MAX_REFRESH_FAILURES = 5        # échecs consécutifs (404, annonce retirée…) avant abandon
+
+def _ttl_case(ttl_hours: Dict[str, float]) -> Tuple[str, list]:
+    """Expression SQL CASE category -> TTL (heures) + paramètres associés."""
+    sql = "CASE category " + " ".join("WHEN ? THEN ?" for _ in ttl_hours) + " ELSE ? END"
+    params: list = []
+    for cat, h in ttl_hours.items():
+        params += [cat, float(h)]
+    return sql, params
+
+def _stale_candidates(conn, table: str, ttl_hours: Dict[str, float], default_ttl: float) -> Iterator[Tuple[float, int, str, str, str]]:
+    """
+    Curseur sur les annonces dont l'âge dépasse le TTL de leur catégorie.
+    Produit (priorité, id, link, category, price_raw) ; priorité = (âge / TTL) x (1 + nb changements de prix).
+    scraped_at NULL (anciennes lignes) = jamais revisitée -> âge très grand.
+    Les annonces en échec MAX_REFRESH_FAILURES fois de suite ne sont plus proposées.
+    """
+    case_sql, case_params = _ttl_case(ttl_hours)
+    q = f"""
+        SELECT id, link, category, price_raw, COALESCE(price_changes, 0),
+               COALESCE((julianday('now') - julianday(scraped_at)) * 24.0, 1e6) AS age_h,
+               {case_sql} AS ttl_h
+        FROM {table}
+        WHERE link LIKE '%/annonce/%'
+          AND COALESCE(refresh_failures, 0) < ?
+          AND (scraped_at IS NULL
+               OR (julianday('now') - julianday(scraped_at)) * 24.0 >= {case_sql})
+    """
+    cur = conn.execute(q, (*case_params, default_ttl, MAX_REFRESH_FAILURES, *case_params, default_ttl))
+    for row_id, link, category, price_raw, changes, age_h, ttl_h in cur:
+        yield ((age_h / max(ttl_h, 1e-6)) * (1 + changes), row_id, link, category, price_raw)
+
+def pick_stale(
+    conn,
+    table: str = "annonces",
+    budget: int = 100,
+    ttl_hours: Optional[Dict[str, float]] = None,
+    default_ttl: float = DEFAULT_TTL_HOURS,
+) -> List[Tuple[float, int, str, str, str]]:
+    """Les `budget` annonces les plus prioritaires (tas borné : O(n log budget), mémoire O(budget))."""
+    ttl = TTL_HOURS if ttl_hours is None else ttl_hours
+    return heapq.nlargest(int(budget), _stale_candidates(conn, table, ttl, default_ttl))
+
+def refresh_stale(
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    budget: int = 100,
+    ttl_hours: Optional[Dict[str, float]] = None,
+    max_workers: int = 8,
+    verify_ssl: bool = True,
+) -> Dict[str, int]:
+    """
+    Revisite au plus `budget` pages DÉTAIL parmi les annonces périmées et met à jour
+    titre/prix/adresse/image + scraped_at. Un prix différent incrémente price_changes,
+    ce qui fait remonter l'annonce lors des passes suivantes ; comme pour l'enrichissement,
+    le nouveau prix rejoint les sketches et une annonce modifiée est réaffectée à un cluster.
+    Échec (404, annonce retirée…) : refresh_failures + 1 et scraped_at repoussé de
+    TTL x (2^(échecs-1) - 1) heures (prochaine visite après TTL, 2 TTL, 4 TTL…) ;
+    abandon après MAX_REFRESH_FAILURES échecs consécutifs. Un succès remet le compteur à 0.
+    Retourne {'selected': X, 'refreshed': Y, 'price_changed': Z, 'failed': W}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    ttl = TTL_HOURS if ttl_hours is None else ttl_hours
+    stats = {'selected': 0, 'refreshed': 0, 'price_changed': 0, 'failed': 0}
+    conn = sqlite3.connect(db_path)
+    try:
+        scraping.ensure_table_sqlite(conn, table)
+        picked = pick_stale(conn, table, budget, ttl)
+        stats['selected'] = len(picked)
+        if not picked:
+            return stats
+
+        rs = scraping._requests_session_from_selenium_cookies([], verify=verify_ssl)
+
+        def fetch(item):
+            _prio, row_id, link, category, old_price = item
+            try:
+                r = rs.get(link, timeout=12)
+                r.raise_for_status()
+                return item, scraping._parse_detail_html(r.text, category)
+            except Exception:
+                return item, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            results = list(ex.map(fetch, picked))
+
+        repriced: List[int] = []
+        modified: List[int] = []
+        for (_prio, row_id, _link, category, old_price), det in results:
+            if det is None:
+                # l'UPDATE lit l'ancien compteur (échecs - 1)
+                conn.execute(
+                    f"""UPDATE {table} SET
+                          refresh_failures = COALESCE(refresh_failures, 0) + 1,
+                          scraped_at = datetime('now', printf('+%f hours',
+                              ? * ((1 << COALESCE(refresh_failures, 0)) - 1)))
+                        WHERE id = ?;""",
+                    (float(ttl.get(category, DEFAULT_TTL_HOURS)), row_id)
+                )
+                stats['failed'] += 1
+                continue
+            new_price = det.get('price_raw')
+            changed = bool(new_price) and (new_price or '') != (old_price or '')
+            address = det.get('address_raw')
+            before = conn.execute(
+                f"SELECT title, address_raw, image_url FROM {table} WHERE id = ?;", (row_id,)
+            ).fetchone() or (None, None, None)
+            if changed:
+                repriced.append(row_id)
+            if changed or any(det.get(f) and det[f] != v
+                              for f, v in zip(('title', 'address_raw', 'image_url'), before)):
+                modified.append(row_id)
+            conn.execute(
+                f"""UPDATE {table} SET
+                      title = COALESCE(?, title),
+                      price_raw = COALESCE(?, price_raw),
+                      address_raw = COALESCE(?, address_raw),
+                      city = COALESCE(?, city),
+                      image_url = COALESCE(?, image_url),
+                      price_changes = COALESCE(price_changes, 0) + ?,
+                      refresh_failures = 0,
+                      scraped_at = CURRENT_TIMESTAMP
+                    WHERE id = ?;""",
+                (det.get('title'), new_price, address, extract_city(address) if address else None,
+                 det.get('image_url'), 1 if changed else 0, row_id)
+            )
+            stats['refreshed'] += 1
+            stats['price_changed'] += int(changed)
+        # nouveau prix observé cette semaine ; signature recalculée si un champ a bougé
+        sketches.ingest_ids(conn, table, repriced)
+        dedup.reassign(conn, table, modified)
+        conn.commit()
+    finally:
+        conn.close()
+    return stats
+
+__all__ = [
+    "pick_stale",
+    "refresh_stale",
+]
+
+if __name__ == "__main__":
+    print(refresh_stale(db_path="coinafrique.db", table="annonces", budget=100))
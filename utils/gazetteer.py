@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# -----------------------------------------------------------------------------
+# Normalisation des adresses : gazetteer (quartiers / villes du Sénégal) compilé en trie de mots
+#   "Grand Yoff, Dakar, Sénégal" -> ('Grand Yoff', 'Dakar')
+#   "Thies, Sénégal"             -> ('Thiès', 'Thiès')
+#   "Dakar Point E"              -> ('Point E', 'Dakar')
+# Recherche segment par segment (séparateurs , • / ; |) : un quartier / une ville l'emporte
+# sur un simple nom de région.
+# -----------------------------------------------------------------------------
+GAZETTEER_VERSION = 3
+
+# région -> lieux (le nom de la région est lui-même un lieu)
+PLACES: Dict[str, List[str]] = {
+    'Dakar': [
+        'Plateau', 'Médina', 'Fass', 'Fass Delorme', 'Colobane', 'Gueule Tapée', 'Fann', 'Point E', 'Amitié',
+        'Mermoz', 'Sacré-Coeur', 'Mermoz-Sacré-Coeur', 'Ouakam', 'Ngor', 'Yoff', 'Almadies', 'Mamelles',
+        'Grand Yoff', 'Grand Dakar', 'Grand Médine', 'HLM', 'Biscuiterie', 'Dieuppeul-Derklé', 'Sicap Liberté',
+        'Sicap Foire', 'Sicap Baobab', 'Liberté 6', 'Castors', 'Ouest Foire', 'Nord Foire', "Patte d'Oie",
+        'Parcelles Assainies', 'Cambérène', 'Hann Bel-Air', 'Hann', 'Mariste', 'Sipres', 'Diamalaye',
+        'Zone de Captage', 'Golf Sud', 'Cité Keur Gorgui', 'VDN', 'Dalifort', 'Yarakh', 'Gorée', 'Bel-Air',
+        'Sicap Amitié', 'Cité Mixta', 'Cité Biagui', 'Cité Djily Mbaye', 'Cité Soprim', 'Cité Assemblée',
+        'Pikine', 'Guédiawaye', 'Thiaroye', 'Keur Massar', 'Mbao', 'Grand Mbao', 'Yeumbeul', 'Malika',
+        'Médina Gounass', 'Golf Nord', 'Sam Notaire', 'Wakhinane Nimzatt', 'Ndiarème Limamoulaye',
+        'Rufisque', 'Bargny', 'Sébikotane', 'Diamniadio', 'Sangalkam', 'Lac Rose', 'Niaga', 'Tivaouane Peulh',
+        'Keur Mbaye Fall', 'Jaxaay', 'Bambilor',
+    ],
+    'Thiès': [
+        'Mbour', 'Saly', 'Ngaparou', 'Somone', 'Popenguine', 'Joal-Fadiouth', 'Tivaouane', 'Pout', 'Khombole',
+        'Mékhé', 'Kayar', 'Nguekhokh',
+    ],
+    'Diourbel': ['Touba', 'Mbacké', 'Bambey'],
+    'Saint-Louis': ['Richard-Toll', 'Dagana', 'Podor'],
+    'Louga': ['Kébémer', 'Linguère'],
+    'Kaolack': ['Nioro du Rip', 'Gassane'],
+    'Fatick': ['Foundiougne', 'Sokone'],
+    'Kaffrine': [],
+    'Matam': ['Ourossogui', 'Kanel'],
+    'Tambacounda': ['Bakel'],
+    'Kédougou': [],
+    'Kolda': ['Vélingara'],
+    'Sédhiou': [],
+    'Ziguinchor': ['Bignona', 'Cap Skirring', 'Oussouye'],
+}
+
+# variantes d'écriture rencontrées dans les annonces -> lieu canonique
+ALIASES: Dict[str, List[str]] = {
+    'Plateau': ['Dakar Plateau'],
+    'Parcelles Assainies': ['Parcelle Assainies', 'Parcelles'],
+    'Mermoz-Sacré-Coeur': ['Mermoz Sacré Coeur'],
+    'Sacré-Coeur': ['Sacre Coeur'],
+    'Saint-Louis': ['Saint Louis', 'St Louis', 'Ndar'],
+    'Guédiawaye': ['Guediawaye'],
+    'Thiès': ['Thies'],
+    'Liberté 6': ['Liberte VI'],
+    'Joal-Fadiouth': ['Joal'],
+    'Mariste': ['Maristes', 'Hann Maristes', 'Hann Mariste'],
+}
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_SEGMENT_RE = re.compile(r'\s*[,•/;|]\s*')
+_END = '$'
+
+def normalize_text(s: str) -> List[str]:
+    """'Sacré-Coeur, Dakar' -> ['sacre', 'coeur', 'dakar'] (sans accents, minuscules, mots)."""
+    s = unicodedata.normalize('NFKD', str(s)).encode('ascii', 'ignore').decode('ascii').lower()
+    return _WORD_RE.findall(s.replace("'", ' '))
+
+def _compile() -> Dict:
+    """Trie de mots : {mot: {mot: …, '$': (lieu, région)}}."""
+    trie: Dict = {}
+    for region, places in PLACES.items():
+        for place in [region] + places:
+            for name in [place] + ALIASES.get(place, []):
+                node = trie
+                for w in normalize_text(name):
+                    node = node.setdefault(w, {})
+                node[_END] = (place, region)
+    return trie
+
+TRIE = _compile()
+
+def _segment_matches(words: List[str]) -> List[Tuple[int, int, Tuple[str, str]]]:
+    """(début, nb de mots, (lieu, région)) : le lieu le plus long à chaque position du segment."""
+    out = []
+    for i in range(len(words)):
+        node, found = TRIE, None
+        for j, w in enumerate(words[i:], 1):
+            node = node.get(w)
+            if node is None:
+                break
+            if _END in node:
+                found = (j, node[_END])
+        if found:
+            out.append((i, *found))
+    return out
+
+def _match(segments: List[List[str]]) -> Optional[Tuple[int, Tuple[str, str]]]:
+    """
+    (indice du segment, (lieu, région)) du meilleur lieu, par ordre de préférence :
+    quartier / ville plutôt que nom de région seul, lieu couvrant tout son segment,
+    segment le plus à gauche, lieu le plus long, puis le plus à gauche.
+    """
+    best, best_key = None, None
+    for k, words in enumerate(segments):
+        for start, size, (place, region) in _segment_matches(words):
+            key = (place != region, size == len(words), -k, size, -start)
+            if best_key is None or key > best_key:
+                best, best_key = (k, (place, region)), key
+    return best
+
+@lru_cache(maxsize=65536)
+def normalize_address(addr: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (lieu, région) pour une adresse brute ; mémorisé par chaîne distincte.
+    Lieu inconnu du gazetteer : premier segment de l'adresse (séparateurs , • / ; |), avec la
+    région si un segment suivant la nomme ("Cité Inconnue, Dakar" -> ('Cité Inconnue', 'Dakar')).
+    """
+    s = str(addr).strip()
+    if not s:
+        return None, None
+    raw = _SEGMENT_RE.split(s)
+    found = _match([normalize_text(seg) for seg in raw])
+    first = next((seg.strip() for seg in raw if seg.strip()), None)
+    if found is None:
+        return first, None
+    k, (place, region) = found
+    if place == region and k > 0 and not _segment_matches(normalize_text(raw[0])) and raw[0].strip():
+        # seule la région est connue : le premier segment est plus précis qu'elle
+        return raw[0].strip(), region
+    return place, region
+
+# -----------------------------------------------------------------------------
+# Persistant (SQLite) : mémo des adresses distinctes + colonne city des annonces
+# -----------------------------------------------------------------------------
+DDL_ADDRESS = """
+CREATE TABLE IF NOT EXISTS address_norm (
+    address TEXT PRIMARY KEY,
+    place TEXT,
+    region TEXT,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gazetteer_state (
+    tbl TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+def ensure_address_tables(conn) -> None:
+    for stmt in DDL_ADDRESS.split(';'):
+        if stmt.strip():
+            conn.execute(stmt)
+
+def needs_backfill(conn, table: str = "annonces") -> bool:
+    """
+    Villes de {table} jamais recalculées, ou par une version antérieure du gazetteer
+    (version appliquée notée par backfill_cities) : à recalculer.
+    """
+    ensure_address_tables(conn)
+    row = conn.execute("SELECT version FROM gazetteer_state WHERE tbl = ?;", (table,)).fetchone()
+    return row is None or row[0] < GAZETTEER_VERSION
+
+def backfill_cities(conn, table: str = "annonces") -> Dict[str, int]:
+    """
+    Normalise chaque adresse distincte absente du mémo (ou d'une version antérieure du gazetteer),
+    puis recopie le lieu dans {table}.city en une passe (recherche par clé dans address_norm)
+    et note la version appliquée pour {table}. Retourne {'addresses': X, 'rows': Y}.
+    """
+    ensure_address_tables(conn)
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table});")}
+    if 'city' not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN city TEXT;")
+    todo = [r[0] for r in conn.execute(
+        f"SELECT DISTINCT t.address_raw FROM {table} t LEFT JOIN address_norm n ON n.address = t.address_raw "
+        f"WHERE t.address_raw IS NOT NULL AND t.address_raw != '' "
+        f"AND (n.address IS NULL OR n.version < ?);", (GAZETTEER_VERSION,)
+    )]
+    conn.executemany(
+        "INSERT OR REPLACE INTO address_norm (address, place, region, version) VALUES (?, ?, ?, ?);",
+        [(a, *normalize_address(a), GAZETTEER_VERSION) for a in todo]
+    )
+    before = conn.total_changes
+    if todo:
+        # nouvelle version du gazetteer ou nouvelles adresses : on recalcule les lignes concernées
+        conn.execute(
+            f"UPDATE {table} SET city = (SELECT place FROM address_norm n WHERE n.address = {table}.address_raw) "
+            f"WHERE address_raw IS NOT NULL "
+            f"AND city IS NOT (SELECT place FROM address_norm n WHERE n.address = {table}.address_raw);"
+        )
+    rows = conn.total_changes - before
+    conn.execute(
+        "INSERT OR REPLACE INTO gazetteer_state (tbl, version) VALUES (?, ?);", (table, GAZETTEER_VERSION)
+    )
+    return {'addresses': len(todo), 'rows': rows}
+
+__all__ = [
+    "normalize_address",
+    "ensure_address_tables",
+    "needs_backfill",
+    "backfill_cities",
+]
+
+if __name__ == "__main__":
+    import sqlite3
+    import utils.sketches as sketches
+    conn = sqlite3.connect("coinafrique.db")
+    try:
+        with conn:
+            res = backfill_cities(conn, "annonces")
+            if res['rows']:
+                # sketches indexés par ville : recalculés avec les villes corrigées
+                res['sketched'] = sketches.reset(conn, "annonces")
+            print(res)
+    finally:
+        conn.close()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import io
+import hashlib
+import sqlite3
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlparse
+from typing import Optional, List, Dict, Tuple
+
+import utils.scraping_bs as scraping
+
+# -----------------------------------------------------------------------------
+# Stockage local des images (adressé par contenu) + manifeste SQLite
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+IMAGES_DIR = ROOT / 'data' / 'raw' / 'images'
+MANIFEST_TABLE = 'image_manifest'
+FAILURES_TABLE = 'image_failures'
+MAX_IMAGE_ATTEMPTS = 3          # au-delà, l'URL n'est plus retentée
+
+DDL_MANIFEST = f"""
+CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+    image_url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    path TEXT NOT NULL,
+    bytes INTEGER,
+    fetched_at TEXT DEFAULT (CURRENT_TIMESTAMP)
+);
+"""
+DDL_FAILURES = f"""
+CREATE TABLE IF NOT EXISTS {FAILURES_TABLE} (
+    image_url TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    failed_at TEXT DEFAULT (CURRENT_TIMESTAMP)
+);
+"""
+
+def ensure_manifest(conn) -> None:
+    conn.execute(DDL_MANIFEST)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{MANIFEST_TABLE}_sha ON {MANIFEST_TABLE}(sha256);")
+    conn.execute(DDL_FAILURES)
+
+# signatures des formats courants -> extension du fichier stocké
+_MAGIC = ((b'\xff\xd8\xff', '.jpg'), (b'\x89PNG', '.png'), (b'GIF8', '.gif'))
+_KNOWN_EXT = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+def _image_ext(data: bytes, url: str = '') -> str:
+    """Extension d'après le contenu (image ré-encodée -> .jpg), sinon d'après l'URL source."""
+    for magic, ext in _MAGIC:
+        if data.startswith(magic):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    ext = PurePosixPath(urlparse(url).path).suffix.lower()
+    return ext if ext in _KNOWN_EXT else '.img'
+
+def _blob_path(sha: str, ext: str = '.jpg') -> Path:
+    return IMAGES_DIR / sha[:2] / f"{sha}{ext}"
+
+def _downscale(data: bytes, max_side: int) -> bytes:
+    """Réduit l'image (côté max) si Pillow est disponible ; sinon renvoie les octets d'origine."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        img = Image.open(io.BytesIO(data))
+        if max(img.size) <= max_side:
+            return data
+        img.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        img.convert('RGB').save(out, format='JPEG', quality=85, optimize=True)
+        return out.getvalue()
+    except Exception:
+        return data
+
+def _store_blob(data: bytes, url: str = '') -> Tuple[str, Path]:
+    """Écrit le blob sous son empreinte SHA-256 (une seule copie par contenu), extension du format réel."""
+    sha = hashlib.sha256(data).hexdigest()
+    path = _blob_path(sha, _image_ext(data, url))
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_bytes(data)
+        tmp.replace(path)
+    return sha, path
+
+def _pending_urls(conn, table: str, limit: Optional[int]) -> List[str]:
+    """
+    URLs d'images des annonces absentes du manifeste (ou dont le fichier a disparu),
+    hors URLs déjà en échec MAX_IMAGE_ATTEMPTS fois.
+    """
+    q = (
+        f"SELECT DISTINCT a.image_url, m.path FROM {table} a "
+        f"LEFT JOIN {MANIFEST_TABLE} m ON m.image_url = a.image_url "
+        f"LEFT JOIN {FAILURES_TABLE} f ON f.image_url = a.image_url "
+        f"WHERE a.image_url IS NOT NULL AND a.image_url != '' "
+        f"AND COALESCE(f.attempts, 0) < ?"
+    )
+    out = []
+    for url, path in conn.execute(q, (MAX_IMAGE_ATTEMPTS,)):
+        if path and (ROOT / path).exists():
+            continue
+        out.append(url)
+        if limit and len(out) >= limit:
+            break
+    return out
+
+def fetch_images(
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    max_workers: int = 8,
+    max_side: Optional[int] = 480,
+    limit: Optional[int] = None,
+    verify_ssl: bool = True,
+) -> Dict[str, int]:
+    """
+    Télécharge en parallèle (pool borné, connexions HTTP réutilisées) les images des annonces
+    non encore présentes localement, les réduit si max_side (Pillow optionnel) et les range
+    sous data/raw/images/<sha[:2]>/<sha>.<ext> (.jpg si ré-encodée, sinon format d'origine).
+    Les relances sautent les URLs déjà stockées ; les échecs sont comptés dans image_failures
+    et l'URL est abandonnée après MAX_IMAGE_ATTEMPTS tentatives.
+    Retourne {'pending': X, 'stored': Y, 'deduped': Z, 'failed': W}.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    stats = {'pending': 0, 'stored': 0, 'deduped': 0, 'failed': 0}
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_manifest(conn)
+        urls = _pending_urls(conn, table, limit)
+        stats['pending'] = len(urls)
+        if not urls:
+            return stats
+
+        rs = scraping._requests_session_from_selenium_cookies(
+            [], pool_connections=max_workers, pool_maxsize=max_workers, verify=verify_ssl
+        )
+
+        def fetch(url: str) -> Tuple[str, Optional[bytes], Optional[str]]:
+            try:
+                r = rs.get(url, timeout=15)
+                r.raise_for_status()
+                data = r.content
+                return url, (_downscale(data, max_side) if max_side else data), None
+            except Exception as e:
+                return url, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            for url, data, err in ex.map(fetch, urls):
+                if not data:
+                    conn.execute(
+                        f"INSERT INTO {FAILURES_TABLE} (image_url, attempts, last_error) VALUES (?, 1, ?) "
+                        f"ON CONFLICT(image_url) DO UPDATE SET attempts = attempts + 1, "
+                        f"last_error = excluded.last_error, failed_at = CURRENT_TIMESTAMP;",
+                        (url, err or 'contenu vide')
+                    )
+                    stats['failed'] += 1
+                    continue
+                sha, path = _store_blob(data, url)
+                known = conn.execute(
+                    f"SELECT 1 FROM {MANIFEST_TABLE} WHERE sha256 = ? LIMIT 1;", (sha,)
+                ).fetchone()
+                stats['deduped' if known else 'stored'] += 1
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {MANIFEST_TABLE} (image_url, sha256, path, bytes) VALUES (?, ?, ?, ?);",
+                    (url, sha, str(path.relative_to(ROOT)), len(data))
+                )
+                conn.execute(f"DELETE FROM {FAILURES_TABLE} WHERE image_url = ?;", (url,))
+        conn.commit()
+    finally:
+        conn.close()
+    return stats
+
+def local_image_paths(conn, urls: List[str]) -> Dict[str, str]:
+    """{image_url: chemin local absolu} pour les URLs présentes dans le manifeste."""
+    urls = [u for u in dict.fromkeys(urls) if u]
+    if not urls:
+        return {}
+    try:
+        out: Dict[str, str] = {}
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            q = f"SELECT image_url, path FROM {MANIFEST_TABLE} WHERE image_url IN ({','.join('?' * len(chunk))});"
+            for url, path in conn.execute(q, chunk):
+                p = ROOT / path
+                if p.exists():
+                    out[url] = str(p)
+        return out
+    except sqlite3.OperationalError:
+        # manifeste pas encore créé
+        return {}
+
+__all__ = [
+    "fetch_images",
+    "local_image_paths",
+]
+
+if __name__ == "__main__":
+    print(fetch_images(db_path="coinafrique.db", table="annonces"))
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+SITE_HOST = 'sn.coinafrique.com'
+
+# /annonce/chiens/chiot-bichon-4739575 -> 4739575
+AD_ID_RE = re.compile(r'-(\d+)$')
+# ?page=3 ou /3 en fin d'URL de liste -> 3
+PAGE_NUM_RE = re.compile(r'(?:[?&]page=(\d+)|/(\d+)/?$)')
+
+def canonicalize_link(url: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Lien d'annonce canonique + identifiant numérique de l'annonce.
+      - schéma https, hôte en minuscules, sans query string ni fragment ni '/' final
+      - ad_id = nombre en fin de slug pour les URLs /annonce/... (None sinon)
+    Retourne (link, ad_id) ; (None, None) si url vide.
+    """
+    if not url:
+        return (None, None)
+    s = str(url).strip()
+    if not s:
+        return (None, None)
+    if s.startswith('//'):
+        s = 'https:' + s
+    elif s.startswith('/'):
+        s = f'https://{SITE_HOST}' + s
+
+    u = urlparse(s)
+    host = (u.netloc or SITE_HOST).lower()
+    path = re.sub(r'/+$', '', u.path)
+    link = f'https://{host}{path}'
+
+    ad_id = None
+    if '/annonce/' in path:
+        m = AD_ID_RE.search(path)
+        if m:
+            ad_id = int(m.group(1))
+    return (link, ad_id)
+
+def extract_ad_id(url: Optional[str]) -> Optional[int]:
+    """Identifiant numérique d'une annonce (None si absent)."""
+    return canonicalize_link(url)[1]
+
+def page_number(url: Optional[str]) -> Optional[int]:
+    """https://…/categorie/chiens?page=3 -> 3 (None si absent)."""
+    if not url:
+        return None
+    m = PAGE_NUM_RE.search(str(url))
+    return int(m.group(1) or m.group(2)) if m else None
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import os
+import gzip
+import json
+import hashlib
+import time
+import shutil
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+import utils.scraping_bs as scraping
+import utils.reader as reader
+import utils.sketches as sketches
+import utils.dedup as dedup
+from utils.export import build_where
+from utils.frames import compact_frame
+from utils.links import canonicalize_link
+from utils.cleaning import extract_city
+
+# -----------------------------------------------------------------------------
+# Stockage partitionné : un fichier SQLite par (catégorie, mois de scraped_at)
+#   data/partitions/<catégorie>/<YYYY-MM>.db   (même schéma que la table unique)
+#   data/partitions/catalog.db                 (catalogue + index global des ad_id)
+# Les requêtes n'ouvrent que les partitions retenues par le catalogue (catégorie, période),
+# du mois le plus récent au plus ancien, jusqu'à atteindre la limite demandée.
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+PART_ROOT = ROOT / 'data' / 'partitions'
+ARCHIVE_DIRNAME = 'archive'
+UNDATED = '0000-00'             # lignes sans scraped_at (anciennes bases)
+COPY_CHUNK = 20_000
+
+_unique_memo: Dict[bytes, int] = {}   # empreinte des représentants lus -> nb d'animaux uniques
+_unique_lock = threading.Lock()
+
+DDL_CATALOG = """
+CREATE TABLE IF NOT EXISTS partitions (
+    category TEXT NOT NULL,
+    month TEXT NOT NULL,
+    path TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'active',       -- active | compacted | archived
+    updated_at TEXT DEFAULT (CURRENT_TIMESTAMP),
+    PRIMARY KEY (category, month)
+);
+CREATE TABLE IF NOT EXISTS partition_keys (
+    ad_id INTEGER PRIMARY KEY,
+    category TEXT,
+    month TEXT
+);
+"""
+
+def slugify(category: str) -> str:
+    """'Poules-Lapins-Pigeons' -> 'poules-lapins-pigeons' ; 'Autres animaux' -> 'autres-animaux'."""
+    s = unicodedata.normalize('NFKD', str(category or 'inconnu')).encode('ascii', 'ignore').decode('ascii')
+    s = ''.join(c if c.isalnum() else '-' for c in s.lower())
+    return '-'.join(p for p in s.split('-') if p) or 'inconnu'
+
+def month_of(ts) -> str:
+    return str(ts)[:7] if ts and str(ts)[:4].isdigit() else UNDATED
+
+def current_month() -> str:
+    # CURRENT_TIMESTAMP de SQLite est en UTC
+    return time.strftime('%Y-%m', time.gmtime())
+
+def catalog_path(root: Path = PART_ROOT) -> Path:
+    return Path(root) / 'catalog.db'
+
+def partition_path(root: Path, category: str, month: str) -> Path:
+    return Path(root) / slugify(category) / f"{month}.db"
+
+def _catalog(root: Path) -> sqlite3.Connection:
+    Path(root).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(catalog_path(root))
+    conn.executescript(DDL_CATALOG)
+    return conn
+
+def _register(cat_conn, root: Path, category: str, month: str, added: int, keys: List[Tuple]) -> None:
+    rel = str(partition_path(root, category, month).relative_to(root))
+    cat_conn.execute(
+        "INSERT INTO partitions (category, month, path, rows) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(category, month) DO UPDATE SET rows = rows + excluded.rows, "
+        "path = excluded.path, state = 'active', updated_at = CURRENT_TIMESTAMP;",
+        (category, month, rel, added)
+    )
+    cat_conn.executemany(
+        "INSERT OR IGNORE INTO partition_keys (ad_id, category, month) VALUES (?, ?, ?);", keys
+    )
+
+def _known_ad_ids(cat_conn, ad_ids: List[int]) -> set:
+    known = set()
+    for i in range(0, len(ad_ids), 500):
+        chunk = ad_ids[i:i + 500]
+        known.update(r[0] for r in cat_conn.execute(
+            f"SELECT ad_id FROM partition_keys WHERE ad_id IN ({','.join('?' * len(chunk))});", chunk
+        ))
+    return known
+
+# -----------------------------------------------------------------------------
+# Écriture
+# -----------------------------------------------------------------------------
+def insert_rows(
+    root: Path,
+    rows: Iterable[Dict],
+    table: str = "annonces",
+    enqueue: bool = False,
+    derived: bool = True,
+) -> int:
+    """
+    Équivalent partitionné de scraping._insert_rows : les lignes vont dans la partition
+    (catégorie, mois courant). Une annonce (ad_id) déjà présente dans n'importe quelle
+    partition est ignorée. enqueue=True : détails incomplets mis en file dans la partition ;
+    derived=False : sketches et clusters laissés à update_derived.
+    Retourne le nb de lignes insérées.
+    """
+    from utils.enrichment import enqueue_incomplete
+
+    root = Path(root)
+    rows = [r for r in rows if r.get('link')]
+    if not rows:
+        return 0
+    month = current_month()
+    inserted = 0
+    cat_conn = _catalog(root)
+    try:
+        keyed = [(r, canonicalize_link(r.get('link'))[1]) for r in rows]
+        known = _known_ad_ids(cat_conn, [a for _, a in keyed if a is not None])
+        groups: Dict[str, List[Tuple[Dict, Optional[int]]]] = {}
+        for r, ad_id in keyed:
+            if ad_id is None or ad_id not in known:
+                groups.setdefault(r.get('category') or '', []).append((r, ad_id))
+        for category, pairs in groups.items():
+            group = [r for r, _ in pairs]
+            path = partition_path(root, category, month)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            pconn = sqlite3.connect(path)
+            try:
+                scraping.ensure_table_sqlite(pconn, table)
+                added = scraping._insert_rows(pconn, group, table, derived)
+                if enqueue:
+                    enqueue_incomplete(pconn, group, table)
+                pconn.commit()
+            finally:
+                pconn.close()
+            keys = [(ad_id, category, month) for _, ad_id in pairs if ad_id is not None]
+            with cat_conn:
+                _register(cat_conn, root, category, month, added, keys)
+            inserted += added
+    finally:
+        cat_conn.close()
+    return inserted
+
+def update_derived(root: Path = PART_ROOT, table: str = "annonces") -> Dict[str, int]:
+    """
+    Passe finale d'un chargement en masse : sketches et clusters des lignes non encore
+    traitées, partition par partition (hors archives). Retourne {'prices': X, 'processed': Y}.
+    """
+    root = Path(root)
+    stats = {'prices': 0, 'processed': 0}
+    for part in prune(root):
+        pconn = sqlite3.connect(root / part['path'])
+        try:
+            with pconn:
+                stats['prices'] += sketches.ingest_new(pconn, table)
+                stats['processed'] += dedup.assign_new(pconn, table)['processed']
+        finally:
+            pconn.close()
+    return stats
+
+def for_each(root: Path, fn, table: str = "annonces", **kwargs) -> Dict[str, object]:
+    """
+    Passe écrite pour une base unique (enrichment.run_enrichment, freshness.refresh_stale…)
+    appliquée à chaque partition hors archives : fn(db_path=<partition>, table=table, **kwargs).
+    Budgets et limites s'entendent par partition ; une annonce rafraîchie reste dans la
+    partition de son premier passage. Retourne {'<catégorie>/<mois>': résultat}.
+    """
+    root = Path(root)
+    return {
+        f"{part['category']}/{part['month']}": fn(db_path=str(root / part['path']), table=table, **kwargs)
+        for part in prune(root)
+    }
+
+def split_database(db_path: str = "coinafrique.db", table: str = "annonces", root: Path = PART_ROOT) -> Dict[str, int]:
+    """
+    Migration : recopie la table unique dans les partitions (catégorie, mois de scraped_at),
+    en conservant scraped_at / price_changes. Relançable : les ad_id déjà dans l'index global
+    (partitions archivées comprises) sont ignorés ; une partition archivée qui reçoit de
+    nouvelles lignes est d'abord restaurée.
+    Retourne {'<catégorie>/<mois>': nb inséré}.
+    """
+    root = Path(root)
+    cols = ['source', 'category', 'title', 'price_raw', 'address_raw', 'image_url',
+            'link', 'page', 'ad_id', 'scraped_at', 'price_changes', 'city']
+    counts: Dict[str, int] = {}
+    src = sqlite3.connect(db_path)
+    cat_conn = _catalog(root)
+    try:
+        have = {r[1] for r in src.execute(f"PRAGMA table_info({table});")}
+        sel = ', '.join(c if c in have else f"NULL AS {c}" for c in cols)
+        cur = src.execute(f"SELECT {sel} FROM {table} ORDER BY id;")
+        while True:
+            batch = cur.fetchmany(COPY_CHUNK)
+            if not batch:
+                break
+            known = _known_ad_ids(cat_conn, [r[8] for r in batch if r[8] is not None])
+            groups: Dict[Tuple[str, str], List[tuple]] = {}
+            for r in batch:
+                if r[8] is None or r[8] not in known:
+                    groups.setdefault((r[1] or '', month_of(r[9])), []).append(r)
+            for (category, month), group in groups.items():
+                state = cat_conn.execute(
+                    "SELECT state FROM partitions WHERE category = ? AND month = ?;", (category, month)
+                ).fetchone()
+                if state and state[0] == 'archived':
+                    restore_partition(root, category, month)
+                path = partition_path(root, category, month)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                pconn = sqlite3.connect(path)
+                try:
+                    scraping.ensure_table_sqlite(pconn, table)
+                    before = pconn.total_changes
+                    pconn.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) "
+                        f"VALUES ({', '.join('?' * len(cols))});",
+                        [tuple(r[:9]) + (r[9] or None, r[10] or 0, r[11] or extract_city(r[4] or None))
+                         for r in group]
+                    )
+                    added = pconn.total_changes - before
+                    sketches.ingest_new(pconn, table)
+                    dedup.assign_new(pconn, table)
+                    pconn.commit()
+                finally:
+                    pconn.close()
+                with cat_conn:
+                    _register(cat_conn, root, category, month, added,
+                              [(r[8], category, month) for r in group if r[8] is not None])
+                k = f"{category}/{month}"
+                counts[k] = counts.get(k, 0) + added
+    finally:
+        src.close()
+        cat_conn.close()
+    return counts
+
+# -----------------------------------------------------------------------------
+# Lecture avec élagage des partitions
+# -----------------------------------------------------------------------------
+def catalog(root: Path = PART_ROOT) -> pd.DataFrame:
+    return reader.read_df(str(catalog_path(root)),
+                          "SELECT * FROM partitions ORDER BY month DESC, category;")
+
+def prune(
+    root: Path = PART_ROOT,
+    category: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    include_archived: bool = False,
+) -> List[Dict]:
+    """Partitions à lire (catégorie / période 'YYYY-MM-DD'), du mois le plus récent au plus ancien."""
+    cat = catalog(root)
+    if cat.empty:
+        return []
+    if not include_archived:
+        cat = cat[cat['state'] != 'archived']
+    if category:
+        cats = [category] if isinstance(category, str) else list(category)
+        cat = cat[cat['category'].isin(cats)]
+    if since:
+        cat = cat[cat['month'] >= str(since)[:7]]
+    if until:
+        cat = cat[(cat['month'] <= str(until)[:7]) & (cat['month'] != UNDATED)]
+    return cat.sort_values(['month', 'category'], ascending=[False, True]).to_dict('records')
+
+def load_listings(
+    root: Path = PART_ROOT,
+    table: str = "annonces",
+    category: Optional[str] = None,
+    limit: Optional[int] = 500,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    search: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Annonces les plus récentes (scraped_at DESC) des seules partitions retenues.
+    Avec une limite, la lecture s'arrête au premier mois qui la complète : le coût ne dépend
+    pas de la profondeur de l'historique.
+    """
+    root = Path(root)
+    where, params = build_where(category=category, since=since, until=until, search=search)
+    out: List[pd.DataFrame] = []
+    n = 0
+    parts = prune(root, category, since, until)
+    for i, part in enumerate(parts):
+        if limit and n >= limit and part['month'] != parts[i - 1]['month']:
+            break
+        q = f"SELECT * FROM {table}{where} ORDER BY scraped_at DESC, id DESC"
+        args = tuple(params)
+        if limit:
+            q += " LIMIT ?"
+            args += (int(limit),)
+        df = reader.read_df(str(root / part['path']), q + ";", args)
+        if not df.empty:
+            out.append(df)
+            n += len(df)
+    if not out:
+        return pd.DataFrame()
+    df = pd.concat(out, ignore_index=True).sort_values(['scraped_at', 'id'], ascending=False)
+    return compact_frame(df.head(limit) if limit else df).reset_index(drop=True)
+
+def price_bands(
+    root: Path = PART_ROOT,
+    by: str = 'city',
+    table: str = "annonces",
+    category: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Bandes p10/p50/p90 : les sketches KLL de chaque partition retenue sont fusionnés par clé
+    (même sortie que sketches.price_bands sur la table unique).
+    """
+    root = Path(root)
+    merged: Dict[str, Dict] = {}
+    for part in prune(root, category, since, until):
+        where = {'city': "category = ? AND city != ? AND week = ?",
+                 'week': "category = ? AND city = ? AND week != ?",
+                 'category': "category != ? AND city = ? AND week = ?"}[by]
+        rows = reader.cached(
+            str(root / part['path']), ('sketch_rows', table, by),
+            lambda conn: conn.execute(
+                f"SELECT {by}, sketch FROM price_sketches WHERE tbl = ? AND {where};",
+                (table, sketches.ALL, sketches.ALL, sketches.ALL)
+            ).fetchall(), default=[]
+        )
+        for key, blob in rows:
+            sk = json.loads(blob)
+            merged[key] = sketches.merge(merged[key], sk) if key in merged else sk
+    cols = [by, 'n'] + [f"p{int(round(q * 100))}" for q in sketches.QUANTILES]
+    out = []
+    for key, sk in merged.items():
+        if sk['n'] < 5:
+            continue
+        t = sketches.cdf_table(sk)
+        out.append([key, sk['n']] + [sketches.quantile(sk, q, t) for q in sketches.QUANTILES])
+    df = pd.DataFrame(out, columns=cols)
+    return df.sort_values(by if by == 'week' else 'n', ascending=(by == 'week')).reset_index(drop=True)
+
+def count_unique(root: Path = PART_ROOT, table: str = "annonces", category: Optional[str] = None) -> int:
+    """
+    Animaux uniques (clusters de quasi-doublons) sur les partitions retenues : les
+    représentants de cluster de chaque partition sont fusionnés (dedup.count_merged), un
+    repost d'un mois à l'autre ou d'une catégorie à l'autre n'est compté qu'une fois.
+    Résultat mémorisé tant que les représentants lus (mis en cache par partition) sont inchangés.
+    """
+    root = Path(root)
+    parts = [
+        reader.cached(str(root / part['path']), ('dup_reps', table, category),
+                      lambda conn: dedup.cluster_representatives(conn, table, category), default=([], 0))
+        for part in prune(root, category)
+    ]
+    h = hashlib.blake2b(digest_size=16)
+    for reps, n in parts:
+        h.update(str(n).encode('ascii'))
+        for b in reps:
+            h.update(b)
+    key = h.digest()
+    with _unique_lock:
+        if key in _unique_memo:
+            return _unique_memo[key]
+    n = dedup.count_merged(parts)
+    with _unique_lock:
+        if len(_unique_memo) >= 8:
+            _unique_memo.pop(next(iter(_unique_memo)))
+        _unique_memo[key] = n
+    return n
+
+# -----------------------------------------------------------------------------
+# Maintenance : compaction et archivage partition par partition
+# -----------------------------------------------------------------------------
+def _months_ago(n: int) -> str:
+    y, m = map(int, current_month().split('-'))
+    m -= n
+    while m <= 0:
+        y, m = y - 1, m + 12
+    return f"{y:04d}-{m:02d}"
+
+def compact_partition(root: Path, category: str, month: str) -> int:
+    """VACUUM + checkpoint WAL + journal DELETE : fichier autonome, minimal. Retourne sa taille."""
+    root = Path(root)
+    path = partition_path(root, category, month)
+    reader.forget(str(path))
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        try:
+            conn.execute("PRAGMA journal_mode = DELETE;")
+        except sqlite3.OperationalError:
+            pass                # lecteur encore ouvert ailleurs : on reste en WAL (checkpoint fait)
+        conn.execute("VACUUM;")
+        conn.execute("PRAGMA optimize;")
+    finally:
+        conn.close()
+    with _catalog(root) as cat_conn:
+        cat_conn.execute(
+            "UPDATE partitions SET state = 'compacted', updated_at = CURRENT_TIMESTAMP "
+            "WHERE category = ? AND month = ?;", (category, month)
+        )
+    return path.stat().st_size
+
+def archive_partition(root: Path, category: str, month: str) -> Path:
+    """
+    Compacte puis gzip la partition vers <root>/archive/ et retire le fichier actif.
+    Les ad_id restent dans l'index global (pas de réinsertion d'une annonce archivée).
+    """
+    root = Path(root)
+    compact_partition(root, category, month)
+    src = partition_path(root, category, month)
+    dst = root / ARCHIVE_DIRNAME / slugify(category) / f"{month}.db.gz"
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(str(dst) + '.tmp')
+    with open(src, 'rb') as fi, gzip.open(tmp, 'wb') as fo:
+        shutil.copyfileobj(fi, fo)
+    os.replace(tmp, dst)
+    src.unlink()
+    with _catalog(root) as cat_conn:
+        cat_conn.execute(
+            "UPDATE partitions SET state = 'archived', path = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE category = ? AND month = ?;", (str(dst.relative_to(root)), category, month)
+        )
+    return dst
+
+def restore_partition(root: Path, category: str, month: str) -> Path:
+    """Décompresse une partition archivée à sa place active."""
+    root = Path(root)
+    src = root / ARCHIVE_DIRNAME / slugify(category) / f"{month}.db.gz"
+    dst = partition_path(root, category, month)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(src, 'rb') as fi, open(dst, 'wb') as fo:
+        shutil.copyfileobj(fi, fo)
+    src.unlink()
+    with _catalog(root) as cat_conn:
+        cat_conn.execute(
+            "UPDATE partitions SET state = 'compacted', path = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE category = ? AND month = ?;", (str(dst.relative_to(root)), category, month)
+        )
+    return dst
+
+def maintain(root: Path = PART_ROOT, compact_after_months: int = 1, archive_after_months: int = 12) -> Dict[str, List[str]]:
+    """
+    Compacte les mois clos et archive les plus anciens (hors partitions UNDATED).
+    Retourne {'compacted': [...], 'archived': [...]}.
+    """
+    root = Path(root)
+    done: Dict[str, List[str]] = {'compacted': [], 'archived': []}
+    with _catalog(root) as cat_conn:
+        parts = cat_conn.execute("SELECT category, month, state FROM partitions;").fetchall()
+    compact_before, archive_before = _months_ago(compact_after_months - 1), _months_ago(archive_after_months - 1)
+    for category, month, state in parts:
+        if state == 'archived':
+            continue
+        # UNDATED ('0000-00') : historique sans date, jamais archivé sur critère d'âge
+        if month < archive_before and month != UNDATED:
+            archive_partition(root, category, month)
+            done['archived'].append(f"{category}/{month}")
+        elif month < compact_before and state == 'active':
+            compact_partition(root, category, month)
+            done['compacted'].append(f"{category}/{month}")
+    return done
+
+__all__ = [
+    "insert_rows",
+    "update_derived",
+    "for_each",
+    "split_database",
+    "prune",
+    "load_listings",
+    "price_bands",
+    "compact_partition",
+    "archive_partition",
+    "restore_partition",
+    "maintain",
+]
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Stockage partitionné (catégorie × mois) des annonces")
+    ap.add_argument('action', choices=['split', 'maintain', 'enrich', 'refresh'])
+    ap.add_argument('--db', default='coinafrique.db')
+    ap.add_argument('--table', default='annonces')
+    ap.add_argument('--root', default=str(PART_ROOT))
+    ap.add_argument('--archive-after', type=int, default=12, help="mois avant archivage")
+    a = ap.parse_args()
+    if a.action == 'split':
+        for k, n in split_database(a.db, a.table, Path(a.root)).items():
+            print(f"{k}: {n}")
+    elif a.action == 'enrich':
+        from utils.enrichment import run_enrichment
+        for k, res in for_each(Path(a.root), run_enrichment, a.table).items():
+            print(f"{k}: {res}")
+    elif a.action == 'refresh':
+        from utils.freshness import refresh_stale
+        for k, res in for_each(Path(a.root), refresh_stale, a.table).items():
+            print(f"{k}: {res}")
+    else:
+        print(maintain(Path(a.root), archive_after_months=a.archive_after))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import hashlib
+import subprocess
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+from utils.cleaning import basic_cleaning
+
+# -----------------------------------------------------------------------------
+# Étape pipeline : CSV Web Scraper -> CSV nettoyés (parallèle, par morceaux)
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+WS_DIR = ROOT / 'data' / 'webscraper_csv'
+CLEAN_DIR = ROOT / 'data' / 'cleaned'
+MANIFEST_PATH = ROOT / 'data' / 'raw' / 'clean_manifest.json'
+LOCK_PATH = ROOT / 'data' / 'raw' / 'clean_pipeline.lock'
+LOCK_MAX_AGE_SEC = 3600
+
+WS_FILES = {
+    'chiens': ('chiens.csv', 'chiens_clean.csv'),
+    'moutons': ('moutons.csv', 'moutons_clean.csv'),
+    'poules_lapins_pigeons': ('poules_lapins_pigeons.csv', 'poules_lapins_pigeons_clean.csv'),
+    'autres_animaux': ('autres_animaux.csv', 'autres_animaux_clean.csv'),
+}
+CHUNK_ROWS = 50_000
+
+def file_sha256(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(block), b''):
+            h.update(b)
+    return h.hexdigest()
+
+def _load_manifest() -> Dict[str, Dict]:
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding='utf-8'))
+    except Exception:
+        return {}
+
+def _save_manifest(data: Dict[str, Dict]) -> None:
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data, indent=2), encoding='utf-8')
+    os.replace(tmp, MANIFEST_PATH)
+
+def _content_hash(path: Path, entry: Optional[Dict]) -> str:
+    """Empreinte du contenu ; mtime/taille identiques au manifeste -> empreinte réutilisée sans relire."""
+    st_ = path.stat()
+    if entry and entry.get('mtime') == st_.st_mtime and entry.get('size') == st_.st_size and entry.get('sha256'):
+        return entry['sha256']
+    return file_sha256(path)
+
+def pending(ws_dir: Path = WS_DIR, clean_dir: Path = CLEAN_DIR) -> Dict[str, str]:
+    """{clé: empreinte} des fichiers bruts dont le contenu n'a pas encore été nettoyé."""
+    manifest = _load_manifest()
+    out = {}
+    for key, (ws_name, clean_name) in WS_FILES.items():
+        ws_path, clean_path = Path(ws_dir) / ws_name, Path(clean_dir) / clean_name
+        if not ws_path.exists():
+            continue
+        sha = _content_hash(ws_path, manifest.get(key))
+        if not clean_path.exists() or manifest.get(key, {}).get('sha256') != sha:
+            out[key] = sha
+    return out
+
+def cleaned_fingerprint(clean_dir: Path = CLEAN_DIR) -> tuple:
+    """(clé, empreinte du manifeste, mtime du nettoyé) par fichier : clé de cache du dashboard."""
+    manifest = _load_manifest()
+    out = []
+    for key, (_, clean_name) in WS_FILES.items():
+        clean_path = Path(clean_dir) / clean_name
+        mtime = clean_path.stat().st_mtime if clean_path.exists() else None
+        out.append((key, manifest.get(key, {}).get('sha256'), mtime))
+    return tuple(out)
+
+def clean_file(ws_path: Path, clean_path: Path, chunksize: int = CHUNK_ROWS) -> int:
+    """
+    Nettoie un CSV brut par morceaux (mémoire bornée) vers clean_path (écriture atomique).
+    Dédoublonnage global via l'empreinte de chaque ligne brute. Retourne le nb de lignes écrites.
+    """
+    seen = set()
+    written = 0
+    tmp = Path(str(clean_path) + '.tmp')
+    header = True
+    with open(tmp, 'w', encoding='utf-8', newline='') as out:
+        for chunk in pd.read_csv(ws_path, chunksize=chunksize):
+            if chunk.empty:
+                continue
+            h = pd.util.hash_pandas_object(chunk, index=False)
+            keep = ~h.duplicated() & ~h.isin(seen)
+            seen.update(h[keep].tolist())
+            df_clean = basic_cleaning(chunk[keep.values], dropna_thresh=0.7, drop_duplicates=False)
+            df_clean.to_csv(out, index=False, header=header)
+            header = False
+            written += len(df_clean)
+    if header:
+        # fichier brut vide : on ne remplace pas le nettoyé existant
+        tmp.unlink(missing_ok=True)
+        return 0
+    os.replace(tmp, clean_path)
+    return written
+
+def _clean_one(args) -> Dict:
+    key, ws_path, clean_path, sha, chunksize = args
+    try:
+        n = clean_file(Path(ws_path), Path(clean_path), chunksize)
+        return {'key': key, 'status': 'cleaned' if n else 'raw_empty', 'rows': n, 'sha256': sha}
+    except Exception as e:
+        return {'key': key, 'status': f'error: {e}', 'rows': 0, 'sha256': None}
+
+def sync_cleaned(
+    ws_dir: Path = WS_DIR,
+    clean_dir: Path = CLEAN_DIR,
+    workers: Optional[int] = None,
+    chunksize: int = CHUNK_ROWS,
+) -> Dict[str, Dict]:
+    """
+    Nettoie en parallèle (pool de processus) les seuls fichiers dont le contenu a changé
+    (manifeste d'empreintes SHA-256). Retourne {clé: {'ws', 'clean', 'status'}}.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    ws_dir, clean_dir = Path(ws_dir), Path(clean_dir)
+    clean_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest()
+    todo = pending(ws_dir, clean_dir)
+
+    results: Dict[str, Dict] = {}
+    for key, (ws_name, clean_name) in WS_FILES.items():
+        ws_path = ws_dir / ws_name
+        status = 'missing_raw' if not ws_path.exists() else ('pending' if key in todo else 'up_to_date')
+        results[key] = {'ws': ws_path, 'clean': clean_dir / clean_name, 'status': status}
+    if not todo:
+        return results
+
+    jobs = [(k, str(ws_dir / WS_FILES[k][0]), str(clean_dir / WS_FILES[k][1]), sha, chunksize)
+            for k, sha in todo.items()]
+    n_workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as ex:
+            done = list(ex.map(_clean_one, jobs))
+    else:
+        done = [_clean_one(j) for j in jobs]
+
+    for r in done:
+        key = r['key']
+        results[key]['status'] = r['status']
+        if r['sha256']:
+            st_ = (ws_dir / WS_FILES[key][0]).stat()
+            manifest[key] = {'sha256': r['sha256'], 'mtime': st_.st_mtime, 'size': st_.st_size}
+    _save_manifest(manifest)
+    return results
+
+# -----------------------------------------------------------------------------
+# Lancement en arrière-plan (depuis le dashboard, sans bloquer le rendu)
+# -----------------------------------------------------------------------------
+def is_running() -> bool:
+    try:
+        return (time.time() - LOCK_PATH.stat().st_mtime) < LOCK_MAX_AGE_SEC
+    except FileNotFoundError:
+        return False
+
+def start_background() -> bool:
+    """Démarre `python -m utils.pipeline` en tâche de fond si aucun nettoyage n'est en cours."""
+    if is_running():
+        return False
+    LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    LOCK_PATH.write_text(str(time.time()), encoding='utf-8')
+    subprocess.Popen(
+        [sys.executable, '-m', 'utils.pipeline'], cwd=str(ROOT),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    return True
+
+if __name__ == "__main__":
+    try:
+        for k, v in sync_cleaned().items():
+            print(f"{k}: {v['status']}")
+    finally:
+        LOCK_PATH.unlink(missing_ok=True)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Profilage du rendu des pages (opt-in, activé par le flag DEBUG de l'app)
+#   - sections : temps mur + allocations (tracemalloc) par bloc de page
+#   - flamegraph optionnel : échantillonnage du thread de rendu -> piles "folded"
+#     (format flamegraph.pl / speedscope) dans data/raw/profiles/
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+PROFILE_DIR = ROOT / 'data' / 'raw' / 'profiles'
+SAMPLE_INTERVAL_SEC = 0.005
+
+_state = threading.local()       # Streamlit : un thread de rendu par session
+
+# tracemalloc est global au processus : compteur des pages profilées en cours (toutes sessions),
+# seule la dernière à sortir arrête le traçage qu'elles ont démarré
+_trace_lock = threading.Lock()
+_trace = {'users': 0, 'owned': False}
+
+def _records() -> List[Dict]:
+    if not hasattr(_state, 'records'):
+        _state.records, _state.stack, _state.enabled = [], [], False
+    return _state.records
+
+def enabled() -> bool:
+    _records()
+    return _state.enabled
+
+def _fold_peak() -> None:
+    """Reporte le pic tracemalloc courant dans les sections ouvertes avant un reset_peak."""
+    peak = tracemalloc.get_traced_memory()[1]
+    for entry in _state.stack:
+        entry['peak_abs'] = max(entry['peak_abs'], peak)
+
+@contextmanager
+def section(name: str):
+    """Mesure un bloc (temps mur, mémoire allouée nette et pic). Sans effet si le profilage est inactif."""
+    if not enabled():
+        yield
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        _fold_peak()
+        tracemalloc.reset_peak()
+    cur0 = tracemalloc.get_traced_memory()[0] if tracing else 0
+    entry = {'name': name, 'cur0': cur0, 'peak_abs': cur0}
+    path = ' / '.join([e['name'] for e in _state.stack] + [name])
+    _state.stack.append(entry)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        if tracing:
+            _fold_peak()
+            cur1 = tracemalloc.get_traced_memory()[0]
+        else:
+            cur1 = cur0
+        _state.stack.pop()
+        _state.records.append({
+            'start': t0,
+            'section': path,
+            'depth': len(_state.stack),
+            'ms': round(ms, 1),
+            'alloc_kib': round((cur1 - cur0) / 1024, 1),
+            'peak_kib': round((entry['peak_abs'] - cur0) / 1024, 1),
+        })
+
+def _start_sampler(target_ident: int, interval: float = SAMPLE_INTERVAL_SEC):
+    """
+    Thread qui échantillonne la pile du thread cible à intervalle fixe.
+    Retourne stop() -> Counter {pile repliée 'f1;f2;f3': nb d'échantillons}.
+    """
+    stacks: Counter = Counter()
+    stop_evt = threading.Event()
+
+    def run():
+        while not stop_evt.wait(interval):
+            frame = sys._current_frames().get(target_ident)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stacks[';'.join(reversed(names))] += 1
+
+    th = threading.Thread(target=run, daemon=True)
+    th.start()
+
+    def stop() -> Counter:
+        stop_evt.set()
+        th.join()
+        return stacks
+    return stop
+
+@contextmanager
+def page(name: str, active: bool = False, flamegraph: bool = False):
+    """
+    Profil d'une page routée : réinitialise les mesures du rendu courant, trace les allocations
+    et, si flamegraph=True, écrit data/raw/profiles/<page>_<horodatage>.folded.
+    Le traçage est partagé entre sessions (arrêté à la sortie de la dernière page profilée) :
+    les allocations de sessions concurrentes entrent dans les mesures.
+    """
+    _records()
+    _state.records, _state.stack, _state.enabled = [], [], bool(active)
+    _state.flame_path = None
+    if not active:
+        yield
+        return
+    with _trace_lock:
+        if _trace['users'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace['owned'] = True
+        _trace['users'] += 1
+    stop_sampler = _start_sampler(threading.get_ident()) if flamegraph else None
+    try:
+        with section(name):
+            yield
+    finally:
+        if stop_sampler:
+            stacks = stop_sampler()
+            if stacks:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                slug = ''.join(c if c.isascii() and c.isalnum() else '_' for c in name.lower()).strip('_')
+                out = PROFILE_DIR / f"{slug}_{time.strftime('%Y%m%d_%H%M%S')}.folded"
+                out.write_text(''.join(f"{s} {n}\n" for s, n in stacks.most_common()), encoding='utf-8')
+                _state.flame_path = out
+        with _trace_lock:
+            _trace['users'] -= 1
+            if _trace['users'] == 0 and _trace['owned']:
+                tracemalloc.stop()
+                _trace['owned'] = False
+        _state.enabled = False
+
+def report() -> pd.DataFrame:
+    """Sections du dernier rendu, dans l'ordre d'ouverture (la page entière en premier)."""
+    recs = sorted(_records(), key=lambda r: r['start'])
+    return pd.DataFrame(recs, columns=['section', 'depth', 'ms', 'alloc_kib', 'peak_kib'])
+
+def last_flamegraph() -> Optional[Path]:
+    _records()
+    return getattr(_state, 'flame_path', None)
+
+__all__ = [
+    "section",
+    "page",
+    "report",
+    "last_flamegraph",
+]
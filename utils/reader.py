@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional
+
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# Connexion SQLite lecture seule, une par processus et par base (app Streamlit)
+#   - mode=ro + query_only, mmap, cache de pages, cache d'instructions préparées
+#   - cache des résultats vidé dès que PRAGMA data_version change (écriture du scraper)
+#   - au plus MAX_READERS bases ouvertes (LRU) : le stockage partitionné ne fait pas
+#     croître les descripteurs de fichiers avec la profondeur de l'historique
+# -----------------------------------------------------------------------------
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_PAGES_KIB = 32 * 1024
+STATEMENT_CACHE = 256
+RESULT_CACHE_SIZE = 64
+MAX_READERS = 32
+
+_READERS: "OrderedDict[str, Dict]" = OrderedDict()
+_READERS_LOCK = threading.Lock()
+
+def _open(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        f"file:{db_path}?mode=ro", uri=True,
+        check_same_thread=False, cached_statements=STATEMENT_CACHE,
+    )
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_PAGES_KIB};")
+    conn.execute("PRAGMA query_only = ON;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+def _close(r: Dict) -> None:
+    # sous le verrou du lecteur : une requête en cours se termine avant la fermeture
+    with r['lock']:
+        r['closed'] = True
+        r['conn'].close()
+
+def get_reader(db_path: str) -> Optional[Dict]:
+    """
+    Lecteur partagé pour db_path ({'conn', 'lock', 'version', 'cache'}), ouvert au premier appel.
+    None si le fichier n'existe pas encore (rien n'est mémorisé : il sera ouvert après le 1er scraping).
+    Les sessions Streamlit tournent dans des threads : tout accès passe par 'lock'.
+    Au-delà de MAX_READERS, le lecteur utilisé le moins récemment est fermé.
+    """
+    p = Path(db_path).resolve()
+    key = str(p)
+    evicted: List[Dict] = []
+    with _READERS_LOCK:
+        r = _READERS.pop(key, None)
+        if r is not None and p.exists():
+            _READERS[key] = r
+            return r
+        if r is not None:
+            evicted.append(r)           # base supprimée depuis : on oublie le lecteur
+        if p.exists():
+            conn = _open(p)
+            r = _READERS[key] = {
+                'conn': conn, 'lock': threading.RLock(), 'closed': False,
+                'version': conn.execute("PRAGMA data_version;").fetchone()[0],
+                'cache': OrderedDict(),
+            }
+            while len(_READERS) > MAX_READERS:
+                evicted.append(_READERS.popitem(last=False)[1])
+        else:
+            r = None
+    for old in evicted:
+        _close(old)
+    return r
+
+def _check_version(r: Dict) -> None:
+    # data_version change quand une AUTRE connexion (scraper, chargeur CSV…) a validé une écriture
+    v = r['conn'].execute("PRAGMA data_version;").fetchone()[0]
+    if v != r['version']:
+        r['version'] = v
+        r['cache'].clear()
+
+def cached(db_path: str, key: Hashable, build, default=None):
+    """
+    Résultat de build(conn) mémorisé sous `key` tant que la base n'a pas été modifiée.
+    Les valeurs mises en cache sont partagées : ne pas les modifier en place.
+    """
+    r = get_reader(db_path)
+    if r is None:
+        return default
+    with r['lock']:
+        if r['closed']:
+            # évincé (LRU) entre get_reader et le verrou : on rouvre
+            return cached(db_path, key, build, default)
+        _check_version(r)
+        if key in r['cache']:
+            r['cache'].move_to_end(key)
+            return r['cache'][key]
+        value = build(r['conn'])
+        r['cache'][key] = value
+        while len(r['cache']) > RESULT_CACHE_SIZE:
+            r['cache'].popitem(last=False)
+        return value
+
+def read_df(db_path: str, sql: str, params: tuple = ()) -> pd.DataFrame:
+    """pd.read_sql_query via la connexion partagée, mis en cache par (sql, params)."""
+    return cached(db_path, ('sql', sql, tuple(params)),
+                  lambda conn: pd.read_sql_query(sql, conn, params=params), default=pd.DataFrame())
+
+def list_tables(db_path: str) -> List[str]:
+    return cached(db_path, ('tables',), lambda conn: [
+        t[0] for t in conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
+    ], default=[])
+
+def table_exists(db_path: str, table: str) -> bool:
+    return table in list_tables(db_path)
+
+def forget(db_path: str) -> None:
+    """Ferme et oublie le lecteur de db_path (avant compaction / archivage du fichier)."""
+    with _READERS_LOCK:
+        r = _READERS.pop(str(Path(db_path).resolve()), None)
+    if r is not None:
+        _close(r)
+
+def close_all() -> None:
+    with _READERS_LOCK:
+        readers = list(_READERS.values())
+        _READERS.clear()
+    for r in readers:
+        _close(r)
+
+__all__ = [
+    "get_reader",
+    "cached",
+    "read_df",
+    "list_tables",
+    "table_exists",
+    "forget",
+]
@@ -1,19 +1,27 @@
-
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 
 import os
+import json
 import shutil
 import time
 import random
 import re
-from typing import Optional, Tuple, List, Dict
+from pathlib import Path
+from typing import Optional, Tuple, List, Dict, Set, Iterator, Iterable
 from urllib.parse import urljoin
 
 import requests
 import pandas as pd
 from bs4 import BeautifulSoup as bs, FeatureNotFound
 
+from utils.links import canonicalize_link
+from utils.db import ensure_ad_id_key
+from utils.sketches import ingest_new as ingest_price_sketches, reset as reset_price_sketches
+from utils.dedup import assign_new as assign_dup_clusters
+from utils.cleaning import extract_city
+import utils.gazetteer as gazetteer
+
 # -----------------------------------------------------------------------------
 # Constantes et sélecteurs
 # -----------------------------------------------------------------------------
@@ -26,6 +34,10 @@ CATEGORIES = {
 }
 PAGE_PATTERNS = ['{base}{path}?page={n}', '{base}{path}/{n}']
 
+# Cache des patterns de pagination appris (catégorie -> index dans PAGE_PATTERNS)
+ROOT = Path(__file__).resolve().parents[1]
+PAGINATION_CACHE_PATH = ROOT / 'data' / 'raw' / 'pagination_cache.json'
+
 PRICE = re.compile(r'(\d[\d\s\.,]*)', re.I)
 BAD_IMG_TOKENS = ['/static/images/countries/', '/static/flags/', '/svg', 'data:image']
 
@@ -40,6 +52,34 @@ DETAIL = {
                'addr':  '.hide-on-med-and-down [data-address] span', 'img': 'div.col:nth-of-type(2) img.ad__card-img'},
 }
 
+# Extraction des cartes de la page LISTE côté navigateur (Selenium)
+LIST_JS = r"""
+const cards = Array.from(document.querySelectorAll('div.col.s6.m4.l3'));
+function pickImg(el){
+  const img = el.querySelector('img.ad__card-img') || el.querySelector('a.card-image img');
+  if(!img) {
+    const a = el.querySelector('a.card-image');
+    if(a && a.style && a.style.backgroundImage){
+      const m = a.style.backgroundImage.match(/url\(['"]?(.*?)['"]?\)/);
+      return m ? m[1] : null;
+    }
+    return null;
+  }
+  return img.getAttribute('data-src') || img.getAttribute('data-lazy') ||
+         img.getAttribute('data-original') || (img.getAttribute('srcset')||'').split(' ')[0] ||
+         img.getAttribute('src');
+}
+return cards.map(c => {
+  const name  = (c.querySelector('p.ad__card-description')?.innerText||'').trim();
+  const price = (c.querySelector('p.ad__card-price')?.innerText||'').trim();
+  const addr  = (c.querySelector('p.ad__card-location span')?.innerText||'').trim();
+  const a     =  c.querySelector('.ad__card-description a[href], a.card-image[href]');
+  const link  = a ? a.href : null;
+  let   img   = pickImg(c);
+  return {name, price, addr, link, img};
+});
+"""
+
 HEADERS = {
     'User-Agent': ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
                    'AppleWebKit/537.36 (KHTML, like Gecko) '
@@ -211,10 +251,96 @@ def _parse_detail_html(html: str, category: str) -> Dict[str, Optional[str]]:
         'image_url': image_url,
     }
 
+def _list_row(category: str, page: int, name, price, addr, link, img) -> Dict:
+    """Ligne standard issue d'une carte de la page LISTE (JS Selenium ou BS4)."""
+    img = _norm_url(img or None)
+    if img and any(t in img for t in BAD_IMG_TOKENS):
+        img = None
+    link, ad_id = canonicalize_link(_norm_url(link or None))
+    return {
+        'source': 'coinafrique-sn',
+        'category': category,
+        'title': name or None,
+        'price_raw': price or None,
+        'address_raw': addr or None,
+        'image_url': img,
+        'link': link,
+        'ad_id': ad_id,
+        'page': page,
+    }
+
+def _parse_list_html(html: str, category: str, page: int) -> List[Dict]:
+    """Extraction des cartes d'une page LISTE (équivalent BS4 du JS Selenium)."""
+    try:
+        soup = bs(html, 'lxml')
+    except FeatureNotFound:
+        soup = bs(html, 'html.parser')
+
+    def txt(el, css: str) -> str:
+        x = el.select_one(css)
+        return x.get_text(strip=True) if x else ''
+
+    rows: List[Dict] = []
+    for c in soup.select('div.col.s6.m4.l3'):
+        a = c.select_one('.ad__card-description a[href], a.card-image[href]')
+        img_url = None
+        img = c.select_one('img.ad__card-img') or c.select_one('a.card-image img')
+        if img:
+            for attr in ('data-src', 'data-lazy', 'data-original', 'srcset', 'src'):
+                v = img.get(attr)
+                if v:
+                    img_url = v.split(' ')[0] if attr == 'srcset' else v
+                    break
+        rows.append(_list_row(
+            category, page,
+            txt(c, 'p.ad__card-description'),
+            txt(c, 'p.ad__card-price'),
+            txt(c, 'p.ad__card-location span'),
+            a.get('href') if a else None,
+            img_url,
+        ))
+    return rows
+
+# -----------------------------------------------------------------------------
+# Pagination : pattern appris par catégorie + découverte de la dernière page
+# -----------------------------------------------------------------------------
+def _load_pagination_cache() -> Dict[str, int]:
+    try:
+        data = json.loads(PAGINATION_CACHE_PATH.read_text(encoding='utf-8'))
+        return {k: int(v) for k, v in data.items() if 0 <= int(v) < len(PAGE_PATTERNS)}
+    except Exception:
+        return {}
+
+def _remember_pattern(category: str, idx: int) -> None:
+    """Mémorise (et persiste) le pattern de pagination qui fonctionne pour la catégorie."""
+    cache = _load_pagination_cache()
+    if cache.get(category) == idx:
+        return
+    cache[category] = idx
+    try:
+        PAGINATION_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        PAGINATION_CACHE_PATH.write_text(json.dumps(cache, indent=2), encoding='utf-8')
+    except Exception:
+        pass
+
+def _page_url(category: str, n: int, pattern_idx: int) -> str:
+    return PAGE_PATTERNS[pattern_idx].format(base=SITE_BASE, path=CATEGORIES[category], n=n)
+
+def _pattern_order(category: str) -> List[int]:
+    """Indices de PAGE_PATTERNS à essayer : le pattern appris d'abord, les autres ensuite."""
+    known = _load_pagination_cache().get(category)
+    order = list(range(len(PAGE_PATTERNS)))
+    if known is not None:
+        order.remove(known)
+        order.insert(0, known)
+    return order
+
 # -----------------------------------------------------------------------------
-# SQLite (enregistrement avec index unique sur link)
+# SQLite (enregistrement avec index unique sur ad_id)
 # -----------------------------------------------------------------------------
 def ensure_table_sqlite(conn, table: str = "annonces"):
+    # WAL (persistant sur le fichier) : l'app lit pendant que le scraper écrit
+    conn.execute("PRAGMA journal_mode = WAL;")
     cur = conn.cursor()
     cur.execute(f"""
         CREATE TABLE IF NOT EXISTS {table} (
@@ -226,15 +352,65 @@ def ensure_table_sqlite(conn, table: str = "annonces"):
             address_raw TEXT,
             image_url TEXT,
             link TEXT,
-            page INTEGER
+            page INTEGER,
+            ad_id INTEGER,
+            scraped_at TEXT DEFAULT (CURRENT_TIMESTAMP),
+            price_changes INTEGER DEFAULT 0,
+            refresh_failures INTEGER DEFAULT 0,
+            city TEXT
         );
     """)
-    cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_link_unique ON {table}(link);")
+    gazetteer.ensure_address_tables(conn)
+    # Anciennes tables : colonnes de fraîcheur ajoutées (ALTER ne permet pas DEFAULT CURRENT_TIMESTAMP)
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table});")}
+    for name, decl in (('scraped_at', 'TEXT'), ('price_changes', 'INTEGER DEFAULT 0'),
+                       ('refresh_failures', 'INTEGER DEFAULT 0'), ('city', 'TEXT')):
+        if name not in cols:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl};")
+    if 'city' not in cols or gazetteer.needs_backfill(conn, table):
+        # colonne city ajoutée ou gazetteer modifié : lieux normalisés recopiés (adresses distinctes),
+        # puis sketches (indexés par ville) recalculés si des villes ont changé
+        if gazetteer.backfill_cities(conn, table)['rows']:
+            reset_price_sketches(conn, table)
     conn.commit()
+    ensure_ad_id_key(conn, table)
+
+def _insert_rows(conn, rows: List[Dict], table: str = "annonces", derived: bool = True) -> int:
+    """
+    INSERT OR IGNORE d'un lot de lignes (dicts) sur une connexion ouverte ; retourne le nb inséré.
+    derived=False (chargement en masse) : sketches et clusters laissés à une passe finale
+    (sketches.ingest_new / dedup.assign_new reprennent au dernier id traité).
+    """
+    if not rows:
+        return 0
+    before = conn.total_changes
+    params = []
+    for r in rows:
+        try:
+            page_val = int(r.get('page') or 0)
+        except Exception:
+            page_val = 0
+        link, ad_id = canonicalize_link(r.get('link'))
+        params.append((
+            r.get('source') or "", r.get('category') or "", r.get('title') or "", r.get('price_raw') or "",
+            r.get('address_raw') or "", r.get('image_url') or "", link or "", page_val, ad_id,
+            extract_city(r.get('address_raw') or None),
+        ))
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {table} "
+        f"(source, category, title, price_raw, address_raw, image_url, link, page, ad_id, city, scraped_at) "
+        f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP);", params
+    )
+    inserted = conn.total_changes - before
+    if inserted and derived:
+        # sketches de quantiles des prix et clusters de quasi-doublons mis à jour dans la même transaction
+        ingest_price_sketches(conn, table)
+        assign_dup_clusters(conn, table)
+    return inserted
 
 def save_df_to_sqlite(df: pd.DataFrame, db_path: str = "coinafrique.db", table: str = "annonces") -> tuple[int, int]:
     """
-    Sauvegarde le DataFrame dans SQLite avec INSERT OR IGNORE sur l'unicité de 'link'.
+    Sauvegarde le DataFrame dans SQLite avec INSERT OR IGNORE sur l'unicité de 'ad_id'.
     Retourne (inserted, total_rows_in_df).
     """
     if df is None or df.empty:
@@ -243,34 +419,53 @@ def save_df_to_sqlite(df: pd.DataFrame, db_path: str = "coinafrique.db", table:
     conn = sqlite3.connect(db_path)
     try:
         ensure_table_sqlite(conn, table)
-        before = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-
         cols = ['source','category','title','price_raw','address_raw','image_url','link','page']
-        rows = []
-        for _, r in df[cols].fillna("").iterrows():
-            try:
-                page_val = int(r['page'])
-            except Exception:
-                page_val = 0
-            rows.append((
-                r['source'], r['category'], r['title'], r['price_raw'],
-                r['address_raw'], r['image_url'], r['link'], page_val
-            ))
-        conn.executemany(
-            f"INSERT OR IGNORE INTO {table} "
-            f"(source, category, title, price_raw, address_raw, image_url, link, page) "
-            f"VALUES (?, ?, ?, ?, ?, ?, ?, ?);", rows
-        )
+        inserted = _insert_rows(conn, df[cols].fillna("").to_dict('records'), table)
         conn.commit()
-        after = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-        return (max(after - before, 0), len(df))
+        return (inserted, len(df))
     finally:
         conn.close()
 
+# -----------------------------------------------------------------------------
+# Checkpoint de reprise (dernière page enregistrée par catégorie)
+# -----------------------------------------------------------------------------
+CHECKPOINT_PATH = ROOT / 'data' / 'raw' / 'scrape_checkpoint.json'
+
+def _checkpoint_key(category: str, db_path: str, table: str) -> str:
+    return f"{os.path.abspath(db_path)}::{table}::{category}"
+
+def _load_checkpoints() -> Dict[str, Dict]:
+    try:
+        return json.loads(CHECKPOINT_PATH.read_text(encoding='utf-8'))
+    except Exception:
+        return {}
+
+def _write_checkpoints(data: Dict[str, Dict]) -> None:
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CHECKPOINT_PATH.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data, indent=2), encoding='utf-8')
+    os.replace(tmp, CHECKPOINT_PATH)   # écriture atomique
+
+def _save_checkpoint(key: str, page: int, start_page: int, end_page: int, done: bool = False) -> None:
+    data = _load_checkpoints()
+    data[key] = {'last_page': int(page), 'start_page': int(start_page), 'end_page': int(end_page),
+                 'done': bool(done)}
+    _write_checkpoints(data)
+
+def _same_run(ck: Optional[Dict], start_page: int, end_page: int) -> bool:
+    # un checkpoint ne vaut que pour la même plage de pages
+    return bool(ck) and int(ck.get('start_page', -1)) == int(start_page) \
+        and int(ck.get('end_page', -1)) == int(end_page)
+
+def _clear_checkpoint(*keys: str) -> None:
+    data = _load_checkpoints()
+    if [data.pop(k) for k in keys if k in data]:
+        _write_checkpoints(data)
+
 # -----------------------------------------------------------------------------
 # Scraper hybride (LISTE rapide / DÉTAIL parallèle)
 # -----------------------------------------------------------------------------
-def scrape_category_to_df(
+def iter_category_batches(
     category: str,
     start_page: int,
     end_page:   int,
@@ -280,16 +475,27 @@ def scrape_category_to_df(
     sleep: Tuple[float, float] = (0.12, 0.35),
     headless: bool = True,
     verify_ssl: bool = True,
-) -> pd.DataFrame:
+    page_workers: int = 6,              # threads pages LISTE
+    seen_links: Optional[Set] = None,
+) -> Iterator[Tuple[int, List[Dict]]]:
     """
-    Charge chaque page LISTE avec Selenium et:
-      - list_only=True  : extrait Nom/Prix/Adresse/Image/Lien via JS (ultra-rapide)
+    Générateur : produit (page, lignes) page par page, dans l'ordre, sans accumuler l'historique.
+    Les annonces déjà vues (seen_links : ad_id ou lien, partagé possible entre appels)
+    sont filtrées au fil de l'eau.
+
+    Charge la 1re page LISTE avec Selenium (cookies, pattern de pagination), puis
+    récupère les pages suivantes en parallèle (requests+BS4, repli Selenium si la page est vide) et:
+      - list_only=True  : extrait Nom/Prix/Adresse/Image/Lien des cartes
       - list_only=False : récupère les LIENS puis visite les DÉTAILS (requests+BS4 en parallèle)
 
-    Retourne un DataFrame colonnes: source, category, title, price_raw, address_raw, image_url, link, page
+    Le pattern de pagination qui fonctionne est mémorisé par catégorie ; le parcours s'arrête
+    avant end_page à la première page vide (après repli Selenium).
+
+    Lignes : dicts source, category, title, price_raw, address_raw, image_url, link, page
     """
     assert category in CATEGORIES, f"Catégorie inconnue: {category}"
 
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     from selenium.webdriver.common.by import By
     from selenium.webdriver.support.ui import WebDriverWait
     from selenium.webdriver.support import expected_conditions as EC
@@ -302,149 +508,164 @@ def scrape_category_to_df(
             EC.presence_of_all_elements_located((By.CSS_SELECTOR, '.ad__card-description a[href]'))
         )
 
-    all_rows: List[Dict] = []
-    try:
-        for p in range(start_page, end_page + 1):
-            page_ok = False
-            # essaie les 2 patterns de pagination
-            for url in (
-                PAGE_PATTERNS[0].format(base=SITE_BASE, path=CATEGORIES[category], n=p),
-                PAGE_PATTERNS[1].format(base=SITE_BASE, path=CATEGORIES[category], n=p),
-            ):
-                try:
-                    driver.get(url)
-                    wait_list_ready()
-                    page_ok = True
-                    break
-                except Exception:
-                    continue
-            # fallback: sans pagination (utile pour p=1 si le site change)
-            if not page_ok and p == 1:
-                try:
-                    driver.get(urljoin(SITE_BASE, CATEGORIES[category]))
-                    wait_list_ready()
-                    page_ok = True
-                except Exception:
-                    pass
-            if not page_ok:
-                time.sleep(random.uniform(*sleep))
-                continue
+    learned: Dict[str, Optional[int]] = {'pattern': None}
 
-            # ---- Mode LISTE ultra-rapide (JS) ----
-            if list_only:
-                js = r"""
-                const cards = Array.from(document.querySelectorAll('div.col.s6.m4.l3'));
-                function pickImg(el){
-                  const img = el.querySelector('img.ad__card-img') || el.querySelector('a.card-image img');
-                  if(!img) {
-                    const a = el.querySelector('a.card-image');
-                    if(a && a.style && a.style.backgroundImage){
-                      const m = a.style.backgroundImage.match(/url\(['"]?(.*?)['"]?\)/);
-                      return m ? m[1] : null;
-                    }
-                    return null;
-                  }
-                  return img.getAttribute('data-src') || img.getAttribute('data-lazy') ||
-                         img.getAttribute('data-original') || (img.getAttribute('srcset')||'').split(' ')[0] ||
-                         img.getAttribute('src');
-                }
-                return cards.map(c => {
-                  const name  = (c.querySelector('p.ad__card-description')?.innerText||'').trim();
-                  const price = (c.querySelector('p.ad__card-price')?.innerText||'').trim();
-                  const addr  = (c.querySelector('p.ad__card-location span')?.innerText||'').trim();
-                  const a     =  c.querySelector('.ad__card-description a[href], a.card-image[href]');
-                  const link  = a ? a.href : null;
-                  let   img   = pickImg(c);
-                  return {name, price, addr, link, img};
-                });
-                """
-                try:
-                    items = driver.execute_script(js) or []
-                except Exception:
-                    items = []
-
-                for it in items:
-                    img = _norm_url(it.get('img') or None)
-                    if img and any(t in img for t in BAD_IMG_TOKENS):
-                        img = None
-                    all_rows.append({
-                        'source': 'coinafrique-sn',
-                        'category': category,
-                        'title': it.get('name') or None,
-                        'price_raw': it.get('price') or None,
-                        'address_raw': it.get('addr') or None,
-                        'image_url': img,
-                        'link': it.get('link') or None,
-                        'page': p,
-                    })
-                time.sleep(random.uniform(*sleep))
-                continue  # page suivante
-
-            # ---- Mode DÉTAIL (requests + BS4) ----
-            anchors = driver.find_elements(By.CSS_SELECTOR, '.ad__card-description a[href]')
-            raw_links = []
-            for a in anchors:
-                href = a.get_attribute('href') or ''
-                if '/annonce/' in href:
-                    raw_links.append(href)
-            links = list(dict.fromkeys(raw_links))
-            if not links:
-                time.sleep(random.uniform(*sleep))
+    def open_list_page(p: int) -> bool:
+        """Charge la page p dans Selenium ; une fois le pattern appris, plus d'essai inutile."""
+        order = [learned['pattern']] if learned['pattern'] is not None else _pattern_order(category)
+        for idx in order:
+            try:
+                driver.get(_page_url(category, p, idx))
+                wait_list_ready()
+                if learned['pattern'] is None:
+                    learned['pattern'] = idx
+                    _remember_pattern(category, idx)
+                return True
+            except Exception:
                 continue
+        # fallback: sans pagination (utile pour p=1 si le site change)
+        if p == 1:
+            try:
+                driver.get(urljoin(SITE_BASE, CATEGORIES[category]))
+                wait_list_ready()
+                return True
+            except Exception:
+                pass
+        return False
+
+    def rows_from_driver(p: int) -> List[Dict]:
+        try:
+            items = driver.execute_script(LIST_JS) or []
+        except Exception:
+            items = []
+        return [
+            _list_row(category, p, it.get('name'), it.get('price'), it.get('addr'), it.get('link'), it.get('img'))
+            for it in items
+        ]
+
+    def fetch_list_page(rs: requests.Session, p: int) -> Tuple[int, List[Dict]]:
+        time.sleep(random.uniform(*sleep))
+        try:
+            r = rs.get(_page_url(category, p, learned['pattern']), timeout=12)
+            r.raise_for_status()
+            return p, _parse_list_html(r.text, category, p)
+        except Exception:
+            return p, []
+
+    def fetch_detail(rs: requests.Session, href: str) -> Dict[str, Optional[str]]:
+        s = requests.Session()
+        s.headers.update(HEADERS)
+        s.verify = verify_ssl
+        # copier les cookies (compat objets cookiejar et dicts)
+        for c in rs.cookies:
+            try:
+                name = getattr(c, 'name', None) or getattr(c, 'key', None)
+                value = getattr(c, 'value', None)
+                domain = getattr(c, 'domain', None) or 'sn.coinafrique.com'
+                if name and value:
+                    s.cookies.set(name, value, domain=domain)
+            except Exception:
+                pass
+        try:
+            r = s.get(href, timeout=12)
+            r.raise_for_status()
+            det = _parse_detail_html(r.text, category)
+            return {
+                'title': det.get('title'),
+                'price_raw': det.get('price_raw'),
+                'address_raw': det.get('address_raw'),
+                'image_url': det.get('image_url'),
+                'link': href
+            }
+        except Exception as e:
+            return {'title': None, 'price_raw': None, 'address_raw': None, 'image_url': None, 'link': href,
+                    'detail_error': str(e)}
+
+    def rows_with_details(rs: requests.Session, list_rows: List[Dict], p: int) -> List[Dict]:
+        links = list(dict.fromkeys(
+            r['link'] for r in list_rows if r.get('link') and '/annonce/' in r['link']
+        ))
+        rows_detail: List[Dict] = []
+        if not links:
+            return rows_detail
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [ex.submit(fetch_detail, rs, href) for href in links]
+            for fu in as_completed(futures):
+                det = fu.result() or {}
+                link, ad_id = canonicalize_link(det.get('link'))
+                rows_detail.append({
+                    'source': 'coinafrique-sn',
+                    'category': category,
+                    'title': det.get('title'),
+                    'price_raw': det.get('price_raw'),
+                    'address_raw': det.get('address_raw'),
+                    'image_url': det.get('image_url'),
+                    'link': link,
+                    'ad_id': ad_id,
+                    'page': p,
+                    'detail_error': det.get('detail_error'),
+                })
+        return rows_detail
+
+    seen: Set = seen_links if seen_links is not None else set()
+
+    def fresh(rows: List[Dict]) -> List[Dict]:
+        out = []
+        for r in rows:
+            key = r.get('ad_id') or r.get('link')
+            if key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            out.append(r)
+        return out
 
-            # Session requests avec cookies Selenium
-            cookies = driver.get_cookies()
-            rs = _requests_session_from_selenium_cookies(
-                cookies, pool_connections=32, pool_maxsize=64, verify=verify_ssl
-            )
-
-            from concurrent.futures import ThreadPoolExecutor, as_completed
-
-            def fetch_detail(href: str) -> Dict[str, Optional[str]]:
-                s = requests.Session()
-                s.headers.update(HEADERS)
-                s.verify = verify_ssl
-                # copier les cookies (compat objets cookiejar et dicts)
-                for c in rs.cookies:
-                    try:
-                        name = getattr(c, 'name', None) or getattr(c, 'key', None)
-                        value = getattr(c, 'value', None)
-                        domain = getattr(c, 'domain', None) or 'sn.coinafrique.com'
-                        if name and value:
-                            s.cookies.set(name, value, domain=domain)
-                    except Exception:
-                        pass
-                try:
-                    r = s.get(href, timeout=12)
-                    r.raise_for_status()
-                    det = _parse_detail_html(r.text, category)
-                    return {
-                        'title': det.get('title'),
-                        'price_raw': det.get('price_raw'),
-                        'address_raw': det.get('address_raw'),
-                        'image_url': det.get('image_url'),
-                        'link': href
-                    }
-                except Exception:
-                    return {'title': None, 'price_raw': None, 'address_raw': None, 'image_url': None, 'link': href}
-
-            rows_detail: List[Dict] = []
-            with ThreadPoolExecutor(max_workers=max_workers) as ex:
-                futures = [ex.submit(fetch_detail, href) for href in links]
-                for fu in as_completed(futures):
-                    det = fu.result() or {}
-                    rows_detail.append({
-                        'source': 'coinafrique-sn',
-                        'category': category,
-                        'title': det.get('title'),
-                        'price_raw': det.get('price_raw'),
-                        'address_raw': det.get('address_raw'),
-                        'image_url': det.get('image_url'),
-                        'link': det.get('link'),
-                        'page': p,
-                    })
-            all_rows.extend(rows_detail)
+    def finish_page(rs: Optional[requests.Session], rows: List[Dict], p: int) -> List[Dict]:
+        rows = fresh(rows)
+        if list_only:
+            return rows
+        return rows_with_details(rs, rows, p)
+
+    try:
+        pages = list(range(start_page, end_page + 1))
+
+        # ---- 1re page via Selenium : cookies + pattern ----
+        first_rows: List[Dict] = []
+        first_page = None
+        while pages and first_page is None:
+            p = pages.pop(0)
+            if open_list_page(p):
+                first_page = p
+                first_rows = rows_from_driver(p)
             time.sleep(random.uniform(*sleep))
+        if first_page is None:
+            return
+
+        rs = _requests_session_from_selenium_cookies(
+            driver.get_cookies(), pool_connections=32, pool_maxsize=64, verify=verify_ssl
+        )
+        yield first_page, finish_page(rs, first_rows, first_page)
+        del first_rows
+
+        # ---- Pages suivantes : fenêtres de page_workers pages en parallèle ----
+        # (le paginateur n'affiche qu'une fenêtre de numéros : on s'arrête sur la 1re page vide)
+        step = max(1, int(page_workers))
+        with ThreadPoolExecutor(max_workers=step) as ex:
+            for i in range(0, len(pages), step):
+                window = pages[i:i + step]
+                by_page: Dict[int, List[Dict]] = {}
+                if learned['pattern'] is not None:
+                    for p, rows in ex.map(lambda n: fetch_list_page(rs, n), window):
+                        by_page[p] = rows
+                for p in window:
+                    rows = by_page.pop(p, None)
+                    # Repli Selenium pour les pages vides (rendu JS, blocage…)
+                    if not rows:
+                        rows = rows_from_driver(p) if open_list_page(p) else []
+                        time.sleep(random.uniform(*sleep))
+                    if not rows:
+                        return          # au-delà de la dernière page de la catégorie
+                    yield p, finish_page(rs, rows, p)
 
     finally:
         try:
@@ -452,11 +673,30 @@ def scrape_category_to_df(
         except Exception:
             pass
 
-    # DataFrame + dédup sur link
-    df = pd.DataFrame(all_rows)
-    if not df.empty and 'link' in df.columns:
-        df = df.drop_duplicates(subset=['link']).reset_index(drop=True)
-    return df
+def scrape_category_to_df(
+    category: str,
+    start_page: int,
+    end_page:   int,
+    list_only:  bool = True,
+    visit_detail: bool = True,
+    max_workers: int = 12,
+    sleep: Tuple[float, float] = (0.12, 0.35),
+    headless: bool = True,
+    verify_ssl: bool = True,
+    page_workers: int = 6,
+) -> pd.DataFrame:
+    """
+    Version DataFrame de iter_category_batches (tout en mémoire, dédup sur link).
+    Retourne un DataFrame colonnes: source, category, title, price_raw, address_raw, image_url, link, page
+    """
+    all_rows: List[Dict] = []
+    for _p, rows in iter_category_batches(
+        category, start_page, end_page, list_only=list_only, visit_detail=visit_detail,
+        max_workers=max_workers, sleep=sleep, headless=headless, verify_ssl=verify_ssl,
+        page_workers=page_workers,
+    ):
+        all_rows.extend(rows)
+    return pd.DataFrame(all_rows)
 
 # -----------------------------------------------------------------------------
 # Wrapper rétro-compatible : bs4_scrape_insert (attendu par l'app)
@@ -473,33 +713,110 @@ def bs4_scrape_insert(
     verify_ssl: bool = True,
     db_path: str = "coinafrique.db",
     table: str = "annonces",
+    resume: bool = True,
+    seen_links: Optional[Set] = None,
+    partition_root: Optional[Path] = None,
+    keep_done: bool = False,
 ) -> int:
     """
-    Exécute le scraping (DataFrame) puis enregistre dans SQLite.
+    Scrape en flux (lot par page) et enregistre chaque lot dans SQLite dès qu'il arrive.
+    Après chaque lot validé (COMMIT), un checkpoint est écrit : si l'exécution est interrompue,
+    resume=True reprend à la page suivant la dernière page enregistrée (même start_page/end_page).
+    keep_done=True : la catégorie terminée reste marquée 'done' (sautée par une reprise) au lieu
+    d'effacer son checkpoint ; utilisé par scrape_categories_insert.
+    En mode DÉTAIL, les annonces incomplètes sont mises en file (utils.enrichment.run_enrichment).
+    partition_root : écriture dans le stockage partitionné (utils.partitions) au lieu de db_path.
     Retourne le nombre de lignes insérées (INSERT OR IGNORE).
     """
-    df = scrape_category_to_df(
-        category=category,
-        start_page=start_page,
-        end_page=end_page,
-        list_only=list_only,
-        visit_detail=visit_detail,
-        max_workers=max_workers,
-        sleep=sleep,
-        headless=headless,
-        verify_ssl=verify_ssl,
-    )
-    inserted, _total = save_df_to_sqlite(df, db_path=db_path, table=table)
+    import sqlite3
+    from utils.enrichment import enqueue_incomplete
+    from utils import partitions
+
+    key = _checkpoint_key(category, str(partition_root or db_path), table)
+    first_page = int(start_page)
+    if resume:
+        ck = _load_checkpoints().get(key)
+        if _same_run(ck, first_page, end_page):
+            if ck.get('done'):
+                return 0         # catégorie déjà terminée dans cette exécution
+            start_page = max(first_page, int(ck.get('last_page', 0)) + 1)
+    else:
+        _clear_checkpoint(key)
+
+    inserted = 0
+    conn = None if partition_root else sqlite3.connect(db_path)
+    try:
+        if conn is not None:
+            ensure_table_sqlite(conn, table)
+        if start_page <= end_page:
+            for p, rows in iter_category_batches(
+                category=category,
+                start_page=start_page,
+                end_page=end_page,
+                list_only=list_only,
+                visit_detail=visit_detail,
+                max_workers=max_workers,
+                sleep=sleep,
+                headless=headless,
+                verify_ssl=verify_ssl,
+                seen_links=seen_links,
+            ):
+                if conn is None:
+                    inserted += partitions.insert_rows(partition_root, rows, table, enqueue=not list_only)
+                else:
+                    inserted += _insert_rows(conn, rows, table)
+                    if not list_only:
+                        # DÉTAILS en échec / partiels -> file de reprise (utils.enrichment)
+                        enqueue_incomplete(conn, rows, table)
+                    conn.commit()
+                _save_checkpoint(key, p, first_page, end_page)
+        if keep_done:
+            _save_checkpoint(key, end_page, first_page, end_page, done=True)
+        else:
+            _clear_checkpoint(key)   # catégorie terminée
+    finally:
+        if conn is not None:
+            conn.close()
     return inserted
 
+def scrape_categories_insert(
+    categories: Iterable[str],
+    start_page: int,
+    end_page: int,
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    resume: bool = True,
+    **kwargs,
+) -> Dict[str, int]:
+    """
+    Enchaîne plusieurs catégories avec bs4_scrape_insert (mêmes checkpoints).
+    Une exécution interrompue puis relancée saute les catégories terminées (marquées 'done')
+    et reprend la catégorie en cours à sa dernière page enregistrée ; les marqueurs ne sont
+    effacés qu'une fois toutes les catégories terminées.
+    Retourne {catégorie: nb inséré}.
+    """
+    categories = list(categories)
+    seen: Set = set()
+    results: Dict[str, int] = {}
+    for cat in categories:
+        results[cat] = bs4_scrape_insert(
+            category=cat, start_page=start_page, end_page=end_page,
+            db_path=db_path, table=table, resume=resume, seen_links=seen, keep_done=True, **kwargs
+        )
+    store = str(kwargs.get('partition_root') or db_path)
+    _clear_checkpoint(*[_checkpoint_key(cat, store, table) for cat in categories])
+    return results
+
 # Ancien alias (si d'autres parties de l'app l'utilisent encore)
 selenium_scrape_insert = bs4_scrape_insert
 
 # Pour import explicite
 __all__ = [
+    "iter_category_batches",
     "scrape_category_to_df",
     "save_df_to_sqlite",
     "bs4_scrape_insert",
+    "scrape_categories_insert",
     "selenium_scrape_insert",
 ]
 
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import json
+import math
+import random
+import sqlite3
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from utils.cleaning import price_to_int, extract_city
+
+# -----------------------------------------------------------------------------
+# Sketches de quantiles KLL (fusionnables) des prix, par catégorie / ville / semaine
+# -----------------------------------------------------------------------------
+K = 200                 # taille du compacteur du haut (erreur de rang ~ 1.7 / K)
+DECAY = 2 / 3           # décroissance des capacités vers les niveaux bas
+ALL = '*'               # valeur "toutes" des clés agrégées (rollups)
+QUANTILES = (0.1, 0.5, 0.9)
+
+_rng = random.Random(20240501)
+
+def new_sketch(k: int = K) -> Dict:
+    """Sketch vide, sérialisable tel quel en JSON : levels[h] contient des valeurs de poids 2**h."""
+    return {'k': k, 'n': 0, 'levels': [[]]}
+
+def _capacity(sk: Dict, h: int) -> int:
+    depth = len(sk['levels']) - 1 - h
+    return max(2, int(math.ceil(sk['k'] * DECAY ** depth)))
+
+def _compress(sk: Dict) -> None:
+    """Compacte le plus bas niveau plein tant que le sketch dépasse sa capacité totale."""
+    levels = sk['levels']
+    while sum(len(l) for l in levels) > sum(_capacity(sk, h) for h in range(len(levels))):
+        for h, items in enumerate(levels):
+            if len(items) >= _capacity(sk, h):
+                if h + 1 == len(levels):
+                    levels.append([])
+                items.sort()
+                keep = [items.pop()] if len(items) % 2 else []
+                levels[h + 1].extend(items[_rng.getrandbits(1)::2])
+                levels[h] = keep
+                break
+
+def update(sk: Dict, values) -> Dict:
+    """Ajoute une ou plusieurs valeurs."""
+    vals = [values] if isinstance(values, (int, float)) else list(values)
+    sk['levels'][0].extend(vals)
+    sk['n'] += len(vals)
+    _compress(sk)
+    return sk
+
+def merge(a: Dict, b: Dict) -> Dict:
+    """Fusion (nouveau sketch) : concaténation niveau par niveau puis compaction."""
+    out = {'k': max(a['k'], b['k']), 'n': a['n'] + b['n'], 'levels': []}
+    for h in range(max(len(a['levels']), len(b['levels']))):
+        la = a['levels'][h] if h < len(a['levels']) else []
+        lb = b['levels'][h] if h < len(b['levels']) else []
+        out['levels'].append(la + lb)
+    _compress(out)
+    return out
+
+def cdf_table(sk: Dict) -> Tuple[List[float], List[float]]:
+    """(valeurs triées, rangs cumulés normalisés) : construit une fois, puis chaque quantile en O(log K)."""
+    pairs = sorted((v, 1 << h) for h, items in enumerate(sk['levels']) for v in items)
+    total = sum(w for _, w in pairs) or 1
+    vals, cum, acc = [], [], 0
+    for v, w in pairs:
+        acc += w
+        vals.append(v)
+        cum.append(acc / total)
+    return vals, cum
+
+def quantile(sk: Dict, q: float, table: Optional[Tuple[List[float], List[float]]] = None) -> Optional[float]:
+    vals, cum = table or cdf_table(sk)
+    if not vals:
+        return None
+    return vals[min(bisect_left(cum, q), len(vals) - 1)]
+
+# -----------------------------------------------------------------------------
+# Persistant (SQLite) : une ligne par (catégorie, ville, semaine) + agrégats '*'
+# -----------------------------------------------------------------------------
+DDL_SKETCH = """
+CREATE TABLE IF NOT EXISTS price_sketches (
+    tbl TEXT NOT NULL,
+    category TEXT NOT NULL,
+    city TEXT NOT NULL,
+    week TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    sketch TEXT NOT NULL,
+    PRIMARY KEY (tbl, category, city, week)
+);
+CREATE TABLE IF NOT EXISTS price_sketch_state (
+    tbl TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+def ensure_sketch_tables(conn) -> None:
+    # instruction par instruction (executescript validerait la transaction en cours)
+    for stmt in DDL_SKETCH.split(';'):
+        if stmt.strip():
+            conn.execute(stmt)
+
+def iso_week(ts) -> Optional[str]:
+    """'2025-03-14 10:02:11' -> '2025-W11' (None si date absente/illisible)."""
+    if not ts:
+        return None
+    try:
+        y, w, _ = datetime.fromisoformat(str(ts)[:19]).isocalendar()
+    except ValueError:
+        return None
+    return f"{y}-W{w:02d}"
+
+def bucket_keys(category, city, week) -> List[Tuple[str, str, str]]:
+    """Clés mises à jour pour une ligne : détail + agrégats utilisés par les graphiques."""
+    cat, cty = category or 'Inconnu', city or 'N/A'
+    keys = [(cat, cty, ALL), (cat, ALL, ALL), (ALL, cty, ALL), (ALL, ALL, ALL)]
+    if week:
+        keys += [(cat, cty, week), (cat, ALL, week), (ALL, ALL, week)]
+    return keys
+
+def _add_rows(conn, table: str, rows) -> int:
+    """Ajoute aux sketches les prix de (category, price_raw, address_raw, scraped_at). Retourne le nb de prix."""
+    pending: Dict[Tuple[str, str, str], List[int]] = {}
+    for category, price_raw, address_raw, scraped_at in rows:
+        price = price_to_int(price_raw)
+        if not price or price <= 0:
+            continue
+        for key in bucket_keys(category, extract_city(address_raw), iso_week(scraped_at)):
+            pending.setdefault(key, []).append(price)
+
+    for (cat, cty, wk), vals in pending.items():
+        r = conn.execute(
+            "SELECT sketch FROM price_sketches WHERE tbl = ? AND category = ? AND city = ? AND week = ?;",
+            (table, cat, cty, wk)
+        ).fetchone()
+        sk = update(json.loads(r[0]) if r else new_sketch(), vals)
+        conn.execute(
+            "INSERT OR REPLACE INTO price_sketches (tbl, category, city, week, n, sketch) VALUES (?, ?, ?, ?, ?, ?);",
+            (table, cat, cty, wk, sk['n'], json.dumps(sk, separators=(',', ':')))
+        )
+    return len(pending.get((ALL, ALL, ALL), []))
+
+def _last_id(conn, table: str) -> int:
+    row = conn.execute("SELECT last_id FROM price_sketch_state WHERE tbl = ?;", (table,)).fetchone()
+    return row[0] if row else 0
+
+def ingest_new(conn, table: str = "annonces") -> int:
+    """
+    Intègre aux sketches les lignes dont l'id dépasse le dernier id traité (sur la connexion
+    ouverte, dans la transaction de l'appelant). Retourne le nb de prix ajoutés.
+    """
+    ensure_sketch_tables(conn)
+    last_id = _last_id(conn, table)
+    seen = {'max_id': last_id}
+
+    def rows():
+        for rid, *rest in conn.execute(
+            f"SELECT id, category, price_raw, address_raw, scraped_at FROM {table} WHERE id > ? ORDER BY id;",
+            (last_id,)
+        ):
+            seen['max_id'] = rid
+            yield rest
+
+    added = _add_rows(conn, table, rows())
+    if seen['max_id'] == last_id:
+        return 0
+    conn.execute("INSERT OR REPLACE INTO price_sketch_state (tbl, last_id) VALUES (?, ?);",
+                 (table, seen['max_id']))
+    return added
+
+def ingest_ids(conn, table: str, ids) -> int:
+    """
+    Intègre des lignes déjà parcourues par ingest_new dont le prix vient d'être complété
+    (utils.enrichment) ; les ids au-delà du dernier id traité sont laissés à ingest_new.
+    """
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    ensure_sketch_tables(conn)
+    last_id = _last_id(conn, table)
+    rows = conn.execute(
+        f"SELECT category, price_raw, address_raw, scraped_at FROM {table} "
+        f"WHERE id <= ? AND id IN ({', '.join('?' * len(ids))});",
+        (last_id, *ids)
+    ).fetchall()
+    return _add_rows(conn, table, rows)
+
+def reset(conn, table: str = "annonces") -> int:
+    """
+    Repart de zéro (ex. après changement de l'extraction de ville) puis réintègre toute la table,
+    dans la transaction de l'appelant. Retourne le nb de prix intégrés.
+    """
+    ensure_sketch_tables(conn)
+    conn.execute("DELETE FROM price_sketches WHERE tbl = ?;", (table,))
+    conn.execute("DELETE FROM price_sketch_state WHERE tbl = ?;", (table,))
+    return ingest_new(conn, table)
+
+def rebuild(db_path: str = "coinafrique.db", table: str = "annonces") -> int:
+    """reset sur sa propre connexion."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            return reset(conn, table)
+    finally:
+        conn.close()
+
+def price_bands(
+    conn,
+    by: str = 'city',
+    table: str = "annonces",
+    category: str = ALL,
+    qs: Sequence[float] = QUANTILES,
+    min_n: int = 5,
+) -> pd.DataFrame:
+    """
+    Quantiles lus directement dans les sketches agrégés, une ligne par ville / semaine / catégorie.
+    Colonnes : <by>, n, p10, p50, p90 (selon qs). by='city' | 'week' | 'category'.
+    """
+    where = {
+        'city': "category = ? AND city != ? AND week = ?",
+        'week': "category = ? AND city = ? AND week != ?",
+        'category': "category != ? AND city = ? AND week = ?",
+    }[by]
+    args = {
+        'city': (category, ALL, ALL),
+        'week': (category, ALL, ALL),
+        'category': (ALL, ALL, ALL),
+    }[by]
+    cols = [by, 'n'] + [f"p{int(round(q * 100))}" for q in qs]
+    try:
+        rows = conn.execute(
+            f"SELECT {by}, n, sketch FROM price_sketches WHERE tbl = ? AND {where} AND n >= ?;",
+            (table, *args, min_n)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return pd.DataFrame(columns=cols)
+    out = []
+    for key, n, blob in rows:
+        sk = json.loads(blob)
+        tbl_ = cdf_table(sk)
+        out.append([key, n] + [quantile(sk, q, tbl_) for q in qs])
+    df = pd.DataFrame(out, columns=cols)
+    return df.sort_values(by if by == 'week' else 'n', ascending=(by == 'week')).reset_index(drop=True)
+
+__all__ = [
+    "new_sketch",
+    "update",
+    "merge",
+    "quantile",
+    "ingest_new",
+    "ingest_ids",
+    "reset",
+    "rebuild",
+    "price_bands",
+]
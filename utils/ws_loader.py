@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import sqlite3
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Optional, List, Dict
+from urllib.parse import urlparse
+
+import pandas as pd
+
+import utils.scraping_bs as scraping
+import utils.sketches as sketches
+import utils.dedup as dedup
+from utils.links import page_number
+
+# -----------------------------------------------------------------------------
+# Chargement en masse : CSV Web Scraper -> table SQLite des annonces
+# -----------------------------------------------------------------------------
+SOURCE = 'webscraper'
+CHUNK_ROWS = 20_000
+
+# colonne cible -> colonnes candidates du CSV (la 1re présente gagne ; motifs glob acceptés)
+DEFAULT_MAPPING: Dict[str, List[str]] = {
+    'title': ['Nom', 'Details', 'title'],
+    'price_raw': ['Prix', 'price_raw'],
+    'address_raw': ['Adresse', 'address_raw'],
+    'image_url': ['Image_lien', 'image_url'],
+    'link': ['container_*', 'link'],
+    'start_url': ['web_scraper_start_url'],
+}
+
+# slug d'URL de catégorie -> libellé utilisé par le scraper
+_SLUG_TO_CATEGORY = {path.rsplit('/', 1)[-1]: cat for cat, path in scraping.CATEGORIES.items()}
+
+def resolve_mapping(columns: List[str], mapping: Optional[Dict[str, List[str]]] = None) -> Dict[str, Optional[str]]:
+    """{colonne cible: colonne source trouvée ou None}."""
+    mapping = mapping or DEFAULT_MAPPING
+    out: Dict[str, Optional[str]] = {}
+    for target, candidates in mapping.items():
+        out[target] = next(
+            (c for pat in candidates for c in columns if fnmatch(str(c), pat)), None
+        )
+    return out
+
+def page_from_url(url) -> Optional[int]:
+    """https://…/categorie/chiens?page=3 -> 3 (None si absent)."""
+    return page_number(url)
+
+def category_from_url(url) -> Optional[str]:
+    """https://…/categorie/chiens?page=3 -> 'Chiens' (None si inconnue)."""
+    if not url:
+        return None
+    parts = [p for p in urlparse(str(url)).path.split('/') if p]
+    if len(parts) >= 2 and parts[0] == 'categorie':
+        return _SLUG_TO_CATEGORY.get(parts[1])
+    return None
+
+def load_ws_csv(
+    path: Path,
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    mapping: Optional[Dict[str, List[str]]] = None,
+    category: Optional[str] = None,
+    chunksize: int = CHUNK_ROWS,
+    partition_root: Optional[Path] = None,
+) -> Dict[str, int]:
+    """
+    Lit le CSV par morceaux et insère chaque morceau en une transaction (INSERT OR IGNORE,
+    dédoublonnage sur ad_id / lien). Sketches de prix et clusters de reposts sont mis à jour
+    en une seule passe à la fin. La page et, à défaut de `category`, la catégorie sont
+    déduites de web_scraper_start_url. partition_root : écriture dans le stockage partitionné.
+    Retourne {'rows': X, 'inserted': Y}.
+    """
+    from utils import partitions
+
+    stats = {'rows': 0, 'inserted': 0}
+    conn = None if partition_root else sqlite3.connect(db_path)
+    try:
+        if conn is not None:
+            # chargement en masse : avec le journal WAL (posé par ensure_table_sqlite), NORMAL ne
+            # synchronise qu'aux checkpoints tout en gardant la base cohérente après une coupure
+            conn.execute("PRAGMA synchronous = NORMAL;")
+            scraping.ensure_table_sqlite(conn, table)
+        cols = None
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+            if cols is None:
+                cols = resolve_mapping(list(chunk.columns), mapping)
+                if not cols.get('link'):
+                    raise ValueError(f"{Path(path).name} : aucune colonne de lien (mapping 'link')")
+
+            def col(target: str) -> List:
+                src = cols.get(target)
+                return chunk[src].tolist() if src else [None] * len(chunk)
+
+            starts = col('start_url')
+            rows = [
+                {
+                    'source': SOURCE,
+                    'category': category or category_from_url(su),
+                    'title': t, 'price_raw': pr, 'address_raw': ad, 'image_url': im,
+                    'link': ln, 'page': page_from_url(su),
+                }
+                for t, pr, ad, im, ln, su in zip(
+                    col('title'), col('price_raw'), col('address_raw'), col('image_url'), col('link'), starts
+                )
+                if ln
+            ]
+            if conn is None:
+                stats['inserted'] += partitions.insert_rows(partition_root, rows, table, derived=False)
+            else:
+                with conn:
+                    stats['inserted'] += scraping._insert_rows(conn, rows, table, derived=False)
+            stats['rows'] += len(chunk)
+        # sketches et clusters en une passe groupée, une fois toutes les lignes insérées
+        if conn is None:
+            partitions.update_derived(partition_root, table)
+        else:
+            with conn:
+                sketches.ingest_new(conn, table)
+                dedup.assign_new(conn, table)
+    finally:
+        if conn is not None:
+            conn.close()
+    return stats
+
+def load_ws_dir(
+    ws_dir: Path,
+    db_path: str = "coinafrique.db",
+    table: str = "annonces",
+    mapping: Optional[Dict[str, List[str]]] = None,
+    chunksize: int = CHUNK_ROWS,
+    partition_root: Optional[Path] = None,
+) -> Dict[str, Dict[str, int]]:
+    """Charge tous les *.csv du dossier. Retourne {nom_fichier: stats ou {'error': …}}."""
+    out: Dict[str, Dict] = {}
+    for p in sorted(Path(ws_dir).glob('*.csv')):
+        try:
+            out[p.name] = load_ws_csv(p, db_path=db_path, table=table, mapping=mapping, chunksize=chunksize,
+                                      partition_root=partition_root)
+        except Exception as e:
+            out[p.name] = {'error': str(e)}
+    return out
+
+__all__ = [
+    "DEFAULT_MAPPING",
+    "load_ws_csv",
+    "load_ws_dir",
+]
+
+if __name__ == "__main__":
+    for name, res in load_ws_dir(Path('data/webscraper_csv')).items():
+        print(name, res)